@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from utils.averaging_math import (AVERAGE_FUNCTIONS, RollingMean, RollingMedian, RollingMedianSkiplist,
+                                  RollingTrimMean)
+
+SCALAR_CLASSES = [RollingMean, RollingMedian, RollingMedianSkiplist, RollingTrimMean]
+
+
+@pytest.mark.parametrize("cls", SCALAR_CLASSES, ids=lambda c: c.__name__)
+def bench_scalar_add_calculate(benchmark, cls, epochs):
+    # поточечные классы: поток значений одного отсчёта одного канала, окно 100
+    values = epochs[:, 0, 0].tolist()
+
+    def run():
+        average = cls([], 100)
+        for value in values:
+            average.add(value)
+            average.calculate()
+    benchmark(run)
+
+
+@pytest.mark.parametrize("method", list(AVERAGE_FUNCTIONS))
+def bench_array_build(benchmark, method, epochs):
+    # создание функции усреднения по уже накопленным эпохам (смена настроек)
+    benchmark(lambda: AVERAGE_FUNCTIONS[method](epochs, 100, True).calculate())
+
+
+@pytest.mark.parametrize("method", list(AVERAGE_FUNCTIONS))
+def bench_array_add_calculate(benchmark, method, epochs):
+    # новая эпоха при n уже накопленных: add + calculate, как при каждом кадре
+    average = AVERAGE_FUNCTIONS[method](epochs, len(epochs), False)
+    epoch = np.array(epochs[0])
+
+    def run():
+        average.add(epoch)
+        average.calculate()
+    benchmark(run)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from widgets.teps_plot import TEPsPlot
+from widgets.topoplot_plot import TopoPlot
+
+N_SAMPLES = 2000
+X_SHIFT = 500       # 100 мс до стимула при Fs = 5000
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["full", "decimate"])
+def teps_plot(request, qapp):
+    # сетка 8 x 8 графиков + оси масштаба, как в TEPsPanel
+    w, h, single_w, single_h = 1000, 700, 100, 70
+    grid = [(20 + (k % 8) * 120, 20 + (k // 8) * 80) for k in range(64)]
+    positions = np.array(grid + [(900, 620)], dtype=float)
+    plot = TEPsPlot(None, positions, single_w=single_w, single_h=single_h, w=w, h=h, decimate=request.param)
+    plot.update_axes([-50, 150, -100, 100])
+    plot.set_x_shift(-X_SHIFT, N_SAMPLES)
+    return plot
+
+
+def bench_teps_update_data(benchmark, teps_plot, all_epochs):
+    data = all_epochs[:100].mean(axis=0)
+    benchmark(teps_plot.update_data, data)
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["no_contours", "contours"])
+def topo_plot(request, qapp, params):
+    plot = TopoPlot(None, w=200, timestamp=30, params=params["TEP_suppl_plot"]["topoplot"])
+    return plot, request.param
+
+
+def bench_topoplot(benchmark, topo_plot, all_epochs):
+    plot, contours = topo_plot
+    values = all_epochs[:100, :, 650].mean(axis=0)
+    benchmark(plot.plot_topomap, values, contours=contours)
@@ -0,0 +1,66 @@
+import gc
+import os
+
+import numpy as np
+import pytest
+
+from utils.autosave import AutosaveWriter
+from utils.averaging_math import AVERAGE_FUNCTIONS
+from utils.processing_worker import ProcessingWorker
+from utils.session_io import SessionWriter
+
+
+@pytest.fixture
+def worker(qapp, epochs):
+    """поток обработки (не запущен) с n эпохами в хранилище: команды вызываются напрямую"""
+    n_channels, n_samples = epochs.shape[1:]
+    worker = ProcessingWorker(n_channels, n_samples, AVERAGE_FUNCTIONS)
+    emg = np.zeros((len(epochs), 2, n_samples))
+    for k, epoch in enumerate(np.concatenate([epochs * 1E-6, emg], axis=1)):
+        worker._process_epoch(epoch, k)
+    yield worker
+    del worker
+    gc.collect()        # хранилище и стадии при n=1000 - гигабайты: освободить до следующего случая
+
+
+@pytest.mark.parametrize("method", list(AVERAGE_FUNCTIONS))
+def bench_create_average_functions(benchmark, worker, method):
+    worker._averaging = (method, 100, True)
+    benchmark(worker._create_average_functions)
+
+
+@pytest.mark.parametrize("method", list(AVERAGE_FUNCTIONS))
+def bench_publish_frame(benchmark, worker, method):
+    # усреднённые TEPs и MEP для кадра (бывший _calculate_avg_TEP)
+    worker.set_averaging((method, 100, True))
+    benchmark(worker._publish)
+
+
+def bench_process_epoch(benchmark, worker, epochs):
+    epoch = np.concatenate([epochs[0] * 1E-6, np.zeros((2, epochs.shape[2]))])
+    benchmark(worker._process_epoch, epoch, -1)
+
+
+def bench_autosave_put(benchmark, tmp_path, epochs):
+    # то, что делает _save_data в потоке диспетчера: копия эпохи в очередь автосохранения
+    msg = np.concatenate([epochs[0], np.zeros((2, epochs.shape[2]))]).T    # [n_samples x n_channels] как от драйвера
+    writer = AutosaveWriter(os.path.join(tmp_path, "autosave.h5"), n_samples=msg.shape[0])   # поток записи не запущен
+
+    def run():
+        writer.put(msg, 0)
+        writer._queue.get_nowait()      # очередь не растёт между повторами
+    benchmark(run)
+
+
+@pytest.mark.parametrize("storage", ["float32", "int16"])
+def bench_session_append(benchmark, tmp_path, epochs, storage):
+    # запись пачки эпох в файл (поток автосохранения)
+    data = np.concatenate([epochs, np.zeros((len(epochs), 2, epochs.shape[2]))], axis=1).astype(np.float32) * 1E-6
+    timestamps = np.arange(len(epochs), dtype=np.int64)
+    scale = 5000E-6 / 32767 if storage == "int16" else None
+
+    def run():
+        with SessionWriter(os.path.join(tmp_path, "session.h5"), data.shape[1], data.shape[2], 5000,
+                           "gzip", storage, scale) as writer:
+            writer.append(data, timestamps)
+    benchmark.pedantic(run, rounds=3, iterations=1)
@@ -0,0 +1,43 @@
+"""Замеры горячих участков (pytest-benchmark) на синтетических эпохах 64 канала x 2000 отсчётов.
+
+Запуск из корня репозитория (нужны resources/ и data/):
+    python -m pytest benchmarks
+Каждый запуск сохраняется в benchmarks/.baselines и сравнивается с последним сохранённым.
+Опорный прогон: python -m pytest benchmarks --benchmark-save=baseline,
+сравнение с ним: --benchmark-compare=<номер> --benchmark-compare-fail=median:10%.
+"""
+import json
+import os
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")    # виджеты без экрана
+
+import numpy as np
+import pytest
+
+N_CHANNELS = 64
+N_SAMPLES = 2000
+N_EPOCHS = (10, 100, 1000)
+
+
+@pytest.fixture(scope="session")
+def params():
+    with open(os.path.join("data", "TEP_visual_settings.json")) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture(scope="session")
+def all_epochs():
+    """TEPs [1000 x 64 x 2000] в мкВ (шум ~10 мкВ), общие для всех замеров"""
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 10, (max(N_EPOCHS), N_CHANNELS, N_SAMPLES))
+
+
+@pytest.fixture(params=N_EPOCHS, ids=lambda n: f"n={n}")
+def epochs(request, all_epochs):
+    return all_epochs[:request.param]
@@ -0,0 +1,42 @@
+import argparse
+import os
+
+import numpy as np
+
+from utils.session_io import STORAGE_TYPES, convert_session, quantization_error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перезапись сессий в компактном формате (int16/float16) с проверкой ошибки квантования")
+    parser.add_argument("files", nargs="+", help="исходные .h5 файлы сессий")
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default="int16")
+    parser.add_argument("--compression", default="gzip", help="gzip, lzf, blosc, zstd или none")
+    parser.add_argument("--suffix", default="_compact", help="суффикс имени нового файла")
+    parser.add_argument("--tolerance-uv", type=float, default=None,
+                        help="допустимая ошибка [мкВ]: при превышении новый файл удаляется")
+    parser.add_argument("--n-samples", type=int, default=None,
+                        help="длина эпохи в отсчётах для ранних autosave-файлов без атрибутов")
+    args = parser.parse_args()
+
+    compression = None if args.compression == "none" else args.compression
+    for src in args.files:
+        root, ext = os.path.splitext(src)
+        dst = f"{root}{args.suffix}{ext}"
+
+        writer = convert_session(src, dst, storage=args.storage, compression=compression, n_samples=args.n_samples)
+        error = quantization_error(src, dst, n_samples=args.n_samples)
+        ratio = os.path.getsize(dst) / os.path.getsize(src)
+
+        print(f">> {src} -> {dst}")
+        print(f"   эпох: {writer.n_written}, размер: {ratio:.1%} от исходного")
+        print(f"   макс. ошибка: {error.max():.4f} мкВ (канал {int(np.argmax(error)) + 1}), "
+              f"EEG: {error[:-2].max():.4f} мкВ, EMG: {error[-2:].max():.4f} мкВ")
+        if writer.n_clipped:
+            print(f"---> {writer.n_clipped} отсчётов обрезано")
+        if args.tolerance_uv is not None and error.max() > args.tolerance_uv:
+            os.remove(dst)
+            print(f"---> Ошибка больше {args.tolerance_uv} мкВ: {dst} удалён")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+
+class FakeDriver:
+    """Замена ResonanceForeignDriver без DLL: тот же интерфейс, данные генерируются в процессе.
+
+    После loadConfig фоновый поток с частотой rate_hz (абсолютные дедлайны, равномерный джиттер
+    +-jitter_s без накопления) вызывает callback каждого inputDataStream с эпохой
+    [n_samples x n_channels] в вольтах: шум EEG, затухающий TEP и MEP на двух последних каналах.
+    Буфер переиспользуется, как у настоящего драйвера. Сообщения outputMessageStream не уходят
+    наружу, а сохраняются в sent_messages: (имя потока, сообщение, time.time()).
+    send_input_message - доставить сообщение подписчикам inputMessageStream.
+    """
+    def __init__(self, name, rate_hz=1.0, jitter_s=0.0, n_channels=66, n_samples=2000, Fs=5000,
+                 window_start_ms=-100, max_epochs=None, seed=None):
+        self.name = name
+        self.rate_hz = rate_hz
+        self.jitter_s = jitter_s
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.max_epochs = max_epochs        # None - до stop()
+        self.config_file = None
+
+        self._rng = np.random.default_rng(seed)
+        self._template = self._make_template(Fs, window_start_ms)
+        self._data_callbacks = []           # (имя, функция(arr, channels, samples, timestamp))
+        self._message_callbacks = {}        # имя -> список функций(bytes, timestamp)
+        self.sent_messages = []
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.n_sent = 0
+
+    def _make_template(self, Fs, window_start_ms):
+        """средний ответ [n_samples x n_channels]: TEP на EEG-каналах, MEP на разнице двух EMG-каналов"""
+        t = (np.arange(self.n_samples) / Fs + window_start_ms / 1000)       # с от стимула
+        after = t > 0
+        tep = np.where(after, 10E-6 * np.sin(2 * np.pi * 12 * t) * np.exp(-t / 0.08), 0.0)
+        mep = np.where(after, 0.5E-3 * np.sin(2 * np.pi * 40 * (t - 0.02)) * np.exp(-((t - 0.03) / 0.008) ** 2), 0.0)
+        template = np.zeros((self.n_samples, self.n_channels))
+        gains = np.linspace(-1, 1, max(1, self.n_channels - 2))
+        template[:, :-2] = tep[:, np.newaxis] * gains                  # разная амплитуда/знак по каналам
+        template[:, -1] = mep
+        return template
+
+    # --- интерфейс Driver ---
+    def loadConfig(self, fileName):
+        self.config_file = fileName
+        self.start()
+
+    def pollEvents(self):
+        pass
+
+    def outputMessageStream(self, name):
+        def sendMessage(message):
+            with self._lock:
+                self.sent_messages.append((name, message, time.time()))
+        return sendMessage
+
+    def inputMessageStream(self, name, callback):
+        self._message_callbacks.setdefault(name, []).append(callback)
+
+    def inputDataStream(self, name, callback, no_numpy=False, readonly=False, monitor=None):
+        buffer = np.empty((self.n_samples, self.n_channels))   # как в Driver: один буфер на все эпохи
+
+        def cb_wrapper(epoch, timestamp):
+            if monitor is not None:
+                monitor.mark_arrival(timestamp)
+            with (monitor.span("driver", timestamp) if monitor is not None else nullcontext()):
+                np.copyto(buffer, epoch)
+                arr = buffer.tolist() if no_numpy else buffer
+                if readonly and not no_numpy:
+                    arr = arr.view()
+                    arr.flags.writeable = False
+            callback(arr, timestamp)
+
+        self._data_callbacks.append((name, cb_wrapper))
+
+    # --- управление ---
+    def send_input_message(self, name, message):
+        for callback in self._message_callbacks.get(name, []):
+            callback(bytes(message, 'utf-8'), time.time_ns())
+
+    def messages(self, name=None):
+        """отправленные сообщения (только тексты), для потока name или всех"""
+        with self._lock:
+            return [message for stream, message, _ in self.sent_messages if name is None or stream == name]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fake-driver", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        t0 = time.perf_counter()
+        period = 1 / self.rate_hz
+        epoch = np.empty((self.n_samples, self.n_channels))
+        k = 0
+        while self.max_epochs is None or k < self.max_epochs:
+            jitter = self._rng.uniform(-self.jitter_s, self.jitter_s) if self.jitter_s > 0 else 0.0
+            remaining = t0 + k * period + jitter - time.perf_counter()     # дедлайн от t0, а не от прошлой эпохи
+            if self._stop_event.wait(max(0.0, remaining)):
+                return
+
+            epoch[:] = self._template
+            epoch[:, :-2] += self._rng.normal(0, 5E-6, (self.n_samples, self.n_channels - 2))   # шум EEG
+            epoch[:, -2:] += self._rng.normal(0, 10E-6, (self.n_samples, 2))                   # шум EMG
+            timestamp = time.time_ns()
+            for _, callback in self._data_callbacks:
+                callback(epoch, timestamp)
+            self.n_sent += 1
+            k += 1
@@ -1,6 +1,7 @@
 import ctypes
 import platform
 import os
+from contextlib import nullcontext
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -60,26 +61,36 @@ class Driver:
         self._callbacks.append(cb)
         self._lib.inputMessageStream(bytes(name, 'utf-8'), cb)
         
-    def inputDataStream(self, name, callback, no_numpy=False):
+    def inputDataStream(self, name, callback, no_numpy=False, readonly=False, monitor=None):
+        # callback получает переиспользуемый буфер: данные валидны только до следующего вызова,
+        # поэтому хранить нужно копию. readonly=True - передать read-only view на этот буфер
+        # monitor - LatencyMonitor: отметка прихода эпохи и время копирования (стадия "driver")
+        if not no_numpy:
+            import numpy as np
+        buffer = {}     # предвыделенный буфер [samples x channels], пересоздаётся только при смене размера
+
         def cb_wrapper(data, channels, samples, timestamp):
+            if monitor is not None:
+                monitor.mark_arrival(timestamp)
+            with (monitor.span("driver", timestamp) if monitor is not None else nullcontext()):
+                arr = convert(data, channels, samples)
+            callback(arr, timestamp)
+
+        def convert(data, channels, samples):
             if no_numpy:
-                arr = []
-                i = 0
-                for s in range(0, samples):
-                    v = []
-                    for c in range(0, channels):
-                        v.append(data[i])
-                        i += 1
-                    arr.append(v)
+                flat = data[:samples * channels]        # один вызов ctypes вместо samples*channels обращений
+                arr = [flat[s * channels:(s + 1) * channels] for s in range(samples)]
             else:
-                import numpy as np
-                arr = np.zeros((samples, channels))
-                i = 0
-                for s in range(0, samples):
-                    for c in range(0, channels):
-                        arr[s,c] = data[i]
-                        i += 1
-            callback(arr, timestamp)
+                view = np.ctypeslib.as_array(data, shape=(samples, channels))   # zero-copy view на память драйвера
+                arr = buffer.get((samples, channels))
+                if arr is None:
+                    buffer.clear()
+                    arr = buffer[(samples, channels)] = np.empty((samples, channels))
+                np.copyto(arr, view)                    # одно копирование: указатель валиден только внутри callback
+                if readonly:
+                    arr = arr.view()
+                    arr.flags.writeable = False
+            return arr
             
         cb = self._dataCallback(cb_wrapper)
         self._callbacks.append(cb)
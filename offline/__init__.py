@@ -0,0 +1,3 @@
+from .batch import load_channels, make_config, process_session, run_batch
+
+__all__ = ["load_channels", "make_config", "process_session", "run_batch"]
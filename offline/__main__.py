@@ -0,0 +1,40 @@
+import argparse
+import glob
+import json
+import os
+
+from offline.batch import make_config, run_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m offline",
+                                     description="Пакетная обработка сохранённых сессий (.h5) без GUI: "
+                                                 "усреднённые TEPs, MEP, амплитуды MEP и топограммы")
+    parser.add_argument("inputs", nargs="+", help="файлы .h5 или папки с ними")
+    parser.add_argument("--out", default="data/offline", help="папка для результатов")
+    parser.add_argument("--settings", default="data/TEP_visual_settings.json")
+    parser.add_argument("--method", default=None, help="метод усреднения (по умолчанию - первый из aver_methods)")
+    parser.add_argument("--n-aver", type=int, default=None, help="сколько последних эпох усреднять (вместе с --last)")
+    parser.add_argument("--last", action="store_true", help="усреднять только последние n_aver эпох")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - число ядер)")
+    parser.add_argument("--no-figures", action="store_true", help="не рисовать .png")
+    args = parser.parse_args()
+
+    with open(args.settings, "r", encoding="utf-8") as f:
+        params = json.load(f)
+    config = make_config(params, method=args.method, n_aver=args.n_aver, aver_all=False if args.last else None)
+
+    files = []
+    for path in args.inputs:
+        files += sorted(glob.glob(os.path.join(path, "*.h5"))) if os.path.isdir(path) else [path]
+    if not files:
+        print("---> Не найдено ни одного .h5 файла")
+        return
+
+    print(f">> {len(files)} файлов -> {args.out}")
+    rows = run_batch(files, args.out, config, n_workers=args.workers, figures=not args.no_figures)
+    print(f">> обработано {len(rows)} из {len(files)}")
+
+
+if __name__ == "__main__":
+    main()
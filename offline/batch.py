@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from utils.averaging_math import AVERAGE_FUNCTIONS
+from utils.processing import (Baseline, LowpassFilter, SpatialFilter, TransformCache,
+                              car_matrix, mep_peak_to_peak, rereference_matrix)
+from utils.session_io import SessionReader, session_summary
+
+CHANNELS_FILE = os.path.join("resources", "mumeg_mks64.ced")
+
+
+def load_channels(file_path=CHANNELS_FILE):
+    """названия каналов и их 2D-позиции для топограмм (как в TopoPlot)"""
+    df = pd.read_csv(file_path, sep="\t")
+    th = np.pi / 180 * np.array(df.theta.values)
+    pos = np.stack([np.round(df.radius.values * np.sin(th), 2),
+                    np.round(df.radius.values * np.cos(th), 2)], axis=1)
+    return df.labels.values, pos
+
+
+def make_config(params, method=None, n_aver=None, aver_all=None):
+    """настройки обработки из TEP_visual_settings.json (те же значения, что в панели настроек при запуске GUI)"""
+    return {
+        "Fs": params["SPEED"]["Fs"],
+        "window_start_ms": params["SPEED"]["window_start"],
+        "n_samples": int((params["SPEED"]["window_end"] - params["SPEED"]["window_start"]) / 1000 * params["SPEED"]["Fs"]),
+        "lowpass": params["high_freq"] if params["lowpass"] else None,
+        "lowpass_zero_phase": params["lowpass_zero_phase"],
+        "baseline": (params["baseline_start"], params["baseline_end"], params["baseline_methods"][0]) if params["baseline"] else None,
+        "CAR_excluded": params["bad_channels"] if params["CAR"] else None,
+        "rereference": params["rereference_channel"][0] if params["rereference"] else None,
+        "method": method or params["aver_methods"][0],
+        "n_aver": n_aver or params["n_aver"],
+        "aver_all": params["aver_all"] if aver_all is None else aver_all,
+        "mep_window_ms": (params["MEP_plot"]["amp_start_ms"], params["MEP_plot"]["amp_end_ms"]),
+        "mep_threshold_mV": 0.5,
+        "timestamps_ms": params["TEP_suppl_plot"]["timestamps_ms"],
+        "topoplot": params["TEP_suppl_plot"]["topoplot"],
+        "chunk_epochs": params["session_chunk_epochs"],
+    }
+
+
+def build_pipeline(config, channels, Fs, n_samples):
+    """цепочка TEPs (lowpass -> baseline -> spatial, как в ProcessingWorker) и Baseline для EMG"""
+    ms_to_sample = lambda x: int(x / 1000 * Fs)
+
+    identity = lambda x: x
+    lowpass = identity
+    if config["lowpass"] is not None:
+        lowpass = LowpassFilter(config["lowpass"], Fs, order=2, zero_phase=config["lowpass_zero_phase"])
+
+    baseline = Baseline()
+    if config["baseline"] is not None:
+        start_ms, end_ms, method = config["baseline"]
+        ind_start = ms_to_sample(start_ms - config["window_start_ms"])
+        baseline = Baseline(ind_start, ind_start + ms_to_sample(end_ms - start_ms) + 1, method)
+
+    spatial = SpatialFilter(stages=("CAR", "rereference"))
+    if config["CAR_excluded"] is not None:
+        spatial.set_stage("CAR", car_matrix([ch not in config["CAR_excluded"] for ch in channels]))
+    if config["rereference"] is not None:
+        spatial.set_stage("rereference", rereference_matrix(len(channels), np.where(channels == config["rereference"])[0][0]))
+
+    pipeline = TransformCache(source=None,
+                              stages=[("lowpass", lowpass), ("baseline", baseline), ("spatial", spatial.apply)],
+                              n_channels=len(channels), n_samples=n_samples)
+    return pipeline.transform, baseline
+
+
+def mep_amplitudes(reader, baseline, start, end):
+    """размах MEP каждой эпохи [мВ] и индекс максимума: читаются только два EMG-канала"""
+    emg = np.stack([reader.channel(reader.n_channels - 2), reader.channel(reader.n_channels - 1)], axis=1) * 1E3
+    emg = baseline(emg)                                 # [n_epochs x 2 x n_samples]    units=[mV]
+    return mep_peak_to_peak(emg[:, 1] - emg[:, 0], start, end)
+
+
+def process_session(file_path, config, out_dir, figures=True):
+    """обработать один файл сессии: сводка в .npz, рисунок в .png; возвращает строку итоговой таблицы"""
+    channels, pos = load_channels()
+    reader = SessionReader(file_path, n_samples=config["n_samples"])
+    Fs = reader.Fs or config["Fs"]
+    ms_to_sample = lambda x: int(x / 1000 * Fs)
+    time_shift = ms_to_sample(-config["window_start_ms"])
+
+    transform, baseline = build_pipeline(config, channels, Fs, reader.n_samples)
+    summary = session_summary(reader, transform, baseline, AVERAGE_FUNCTIONS[config["method"]],
+                              config["n_aver"], config["aver_all"], chunk_epochs=config["chunk_epochs"])
+
+    start, end = (time_shift + ms_to_sample(t) for t in config["mep_window_ms"])
+    amps, max_ind = mep_amplitudes(reader, baseline, start, end)
+    latencies = (start + max_ind - time_shift) * 1000 / Fs      # мс от стимула
+
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    times_ms = (np.arange(reader.n_samples) - time_shift) * 1000 / Fs
+    np.savez(os.path.join(out_dir, f"{name}.npz"), TEPs=summary["TEPs"], MEP=summary["MEP"],
+             mep_amplitude=amps, mep_latency_ms=latencies, times_ms=times_ms, channels=channels)
+    if figures:
+        plot_summary(os.path.join(out_dir, f"{name}.png"), name, summary, times_ms, pos, config)
+
+    return {"file": name, "n_epochs": summary["n_epochs"],
+            "mep_mean_mV": float(np.mean(amps)), "mep_median_mV": float(np.median(amps)),
+            "n_mep_above_threshold": int(np.sum(amps > config["mep_threshold_mV"])),
+            "mep_latency_median_ms": float(np.median(latencies))}
+
+
+def plot_summary(file_path, title, summary, times_ms, pos, config):
+    """TEPs всех каналов, средний MEP и топограммы в заданные моменты времени"""
+    import matplotlib
+    matplotlib.use("Agg")       # без окон: рисунок сразу в файл
+    import matplotlib.pyplot as plt
+    import mne
+
+    timestamps = config["timestamps_ms"]
+    topo = config["topoplot"]
+    fig, axes = plt.subplots(2, max(2, len(timestamps)), figsize=(4 * max(2, len(timestamps)), 7))
+    fig.suptitle(f"{title} ({summary['n_epochs']} эпох, {config['method']})")
+
+    ax = axes[0, 0]
+    ax.plot(times_ms, summary["TEPs"].T, color="gray", linewidth=0.5)
+    ax.set(xlabel="мс", ylabel="мкВ", title="TEPs")
+    ax = axes[0, 1]
+    ax.plot(times_ms, summary["MEP"], color="black")
+    ax.axvspan(*config["mep_window_ms"], color="orange", alpha=0.2)
+    ax.set(xlabel="мс", ylabel="мВ", title="Averaged MEP")
+    for ax in axes[0, 2:]:
+        ax.set_axis_off()
+
+    for ax, t_ms in zip(axes[1], timestamps):
+        t = int(np.argmin(np.abs(times_ms - t_ms)))
+        mne.viz.plot_topomap(summary["TEPs"][:, t], pos, axes=ax, show=False, cmap="jet",
+                             vlim=(topo["vmin"], topo["vmax"]), contours=topo["countours"],
+                             ch_type='eeg', extrapolate='head', image_interp=topo["image_interp"],
+                             sensors=topo["sensors"], sphere=topo["sphere"])
+        ax.set_title(f"{t_ms} мс")
+    for ax in axes[1, len(timestamps):]:
+        ax.set_axis_off()
+
+    fig.savefig(file_path, dpi=100)
+    plt.close(fig)
+
+
+def run_batch(files, out_dir, config, n_workers=None, figures=True):
+    """обработать файлы параллельно (по процессу на файл) и записать summary.csv"""
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = {pool.submit(process_session, path, config, out_dir, figures): path for path in files}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                rows.append(future.result())
+                print(f">> {path}: готово")
+            except Exception as e:
+                print(f"---> Ошибка обработки {path}: {e}")
+
+    rows.sort(key=lambda row: row["file"])
+    if rows:
+        with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        with open(os.path.join(out_dir, "config.json"), "w") as f:
+            json.dump(config, f, indent=4, ensure_ascii=False)     # с какими настройками получены результаты
+    return rows
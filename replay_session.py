@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from PyQt5.QtWidgets import QApplication
+
+from utils.theme_loader import load_qss
+from utils.resonance_control import ResonanceAppProxy
+from utils.dispatcher import CallDispatcher
+from utils.latency import monitor as latency_monitor
+from utils.replay import StreamReplayer
+from ui.main_window import MainWindow
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение сохранённой сессии (.h5) в приложении без Резонанса")
+    parser.add_argument("file", help="autosave или экспорт .h5")
+    parser.add_argument("--speed", type=float, default=1.0, help="во сколько раз быстрее реального времени (inf - без пауз)")
+    parser.add_argument("--period", type=float, default=None, help="интервал между эпохами [с] вместо сохранённых timestamps")
+    parser.add_argument("--burst", type=int, default=1, help="отправлять эпохи пачками по N подряд")
+    parser.add_argument("--loop", action="store_true", help="повторять сессию до закрытия окна")
+    parser.add_argument("--settings", default="data/TEP_visual_settings.json")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    app.setStyleSheet(load_qss(r"styles/theme.qss", r"styles/palette.json"))
+
+    # настройки приложения без запуска батника Резонанса
+    with open(args.settings) as f:
+        params = json.load(f)
+    params["record"]["activate_bat"] = False
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(params, f)
+        filename_params = f.name
+
+    dispatcher = CallDispatcher()
+    resonance = ResonanceAppProxy(lambda message: None)     # управляющие сообщения никуда не уходят
+    main_window = MainWindow(dispatcher, resonance, filename_params)   # noqa: F841 - ссылка держит окно живым до выхода
+    os.remove(filename_params)
+
+    speed = params["SPEED"]
+    n_samples = int((speed["window_end"] - speed["window_start"]) / 1000 * speed["Fs"])     # для ранних autosave без атрибутов
+    try:
+        replayer = StreamReplayer(args.file, dispatcher, speed=args.speed, period_s=args.period,
+                                  burst=args.burst, loop=args.loop, monitor=latency_monitor, n_samples=n_samples)
+    except ValueError as e:
+        print(f"---> {e}")
+        sys.exit(1)
+    replayer.start()
+    app.aboutToQuit.connect(replayer.stop)
+
+    code = app.exec_()
+    stats = replayer.stats()
+    print(f">> replay: {stats['sent']} эпох за {stats['elapsed_s']:.1f} с ({stats['epochs_per_s']:.1f} эпох/с), "
+          f"опозданий > 1 мс: {stats['late']}, макс. {stats['max_lag_ms']:.2f} мс")
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
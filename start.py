@@ -1,4 +1,5 @@
 from PyQt5.QtWidgets import QApplication
+import argparse
 import os
 import sys
 import time
@@ -7,15 +8,29 @@ from utils.theme_loader import load_qss
 from utils.resonance_control import ResonanceAppProxy
 
 from utils.dispatcher import CallDispatcher
-from drivers.resonance_foreign_driver import Driver
+from utils.latency import monitor as latency_monitor
 from ui.main_window import MainWindow
 
+# --fake: генератор данных вместо Резонанса (без DLL), например для замеров пропускной способности
+parser = argparse.ArgumentParser()
+parser.add_argument("--fake", action="store_true", help="использовать FakeDriver вместо ResonanceForeignDriver")
+parser.add_argument("--rate", type=float, default=1.0, help="FakeDriver: эпох в секунду")
+parser.add_argument("--jitter", type=float, default=0.0, help="FakeDriver: джиттер моментов прихода эпох [с]")
+parser.add_argument("--channels", type=int, default=66, help="FakeDriver: число каналов (64 EEG + 2 EMG)")
+args, qt_args = parser.parse_known_args()
+
+if args.fake:
+    from drivers.fake_driver import FakeDriver
+    Driver = lambda name: FakeDriver(name, rate_hz=args.rate, jitter_s=args.jitter, n_channels=args.channels)
+else:
+    from drivers.resonance_foreign_driver import Driver
+
 
 os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = r'.\venv\Lib\site-packages\PyQt5\Qt5\plugins'
 os.environ['PATH'] += r';~qgis directoryqt\apps\qgis\bin;~qgis directory\apps\Qt5\bin'
 
 # == Создание главный объект приложения Qt == 
-app = QApplication(sys.argv)    
+app = QApplication(sys.argv[:1] + qt_args)    
 
 style = load_qss(r"styles/theme.qss", r"styles/palette.json")   # подгрузка стиля
 
@@ -26,7 +41,7 @@ app.setStyleSheet(style)
 driver = Driver("TEP_visual")
 
 dispatcher = CallDispatcher()                                            # пустая функция-обработчик
-driver.inputDataStream("epochs", dispatcher)                             # создание входного потока данных типа Stream
+driver.inputDataStream("epochs", dispatcher, monitor=latency_monitor)    # создание входного потока данных типа Stream
 
 output_stream = driver.outputMessageStream("controlSignal")           # создание выходного потока данных типа Stream
 resonance = ResonanceAppProxy(output_stream)                             # Создаем прокси резонанса
@@ -0,0 +1,85 @@
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+
+from utils.averaging_math import IndexableSkiplist, RollingMedianSkiplist, RollingMedianSortedArray
+
+
+def test_skiplist_matches_sorted_list():
+    random.seed(0)
+    rng = np.random.default_rng(0)
+    initial = sorted(rng.integers(0, 10, 20).tolist())     # малый диапазон - много повторов
+    skiplist = IndexableSkiplist(expected_size=64, values=initial)
+    expected = list(initial)
+
+    for _ in range(500):
+        if expected and rng.random() < 0.4:
+            value = expected[rng.integers(len(expected))]
+            skiplist.remove(value)
+            expected.remove(value)
+        else:
+            value = int(rng.integers(0, 10))
+            skiplist.insert(value)
+            expected.append(value)
+            expected.sort()
+        assert len(skiplist) == len(expected)
+        assert [skiplist[i] for i in range(len(skiplist))] == expected
+
+
+def test_skiplist_remove_missing_value():
+    skiplist = IndexableSkiplist(values=[1, 2, 3])
+    with pytest.raises(KeyError):
+        skiplist.remove(5)
+
+
+@pytest.mark.parametrize("save_all", [False, True])
+def test_rolling_median_skiplist(save_all):
+    random.seed(1)
+    rng = np.random.default_rng(1)
+    data = rng.integers(0, 5, 7).tolist()
+    median = RollingMedianSkiplist(data, n_max=5, save_all=save_all)
+    window = deque(data if save_all else data[-5:])
+    assert median.calculate() == np.median(window)
+
+    for value in rng.integers(0, 5, 50).tolist():
+        median.add(value)
+        window.append(value)
+        if not save_all and len(window) > 5:
+            window.popleft()
+        assert median.calculate() == np.median(window)
+
+
+@pytest.mark.parametrize("save_all", [False, True])
+@pytest.mark.parametrize("n_initial", [0, 3, 10])
+def test_rolling_median_sorted_array(save_all, n_initial):
+    rng = np.random.default_rng(2)
+    shape = (3, 4)
+    data = rng.integers(-3, 4, (n_initial,) + shape).astype(np.float32)    # целые - повторы в каждом столбце
+    median = RollingMedianSortedArray(data, n_max=6, save_all=save_all)
+    window = deque(data if save_all else data[-6:])
+    if window:
+        np.testing.assert_array_equal(median.calculate(), np.median(np.array(window), axis=0))
+    else:
+        assert median.calculate() is None
+
+    for value in rng.integers(-3, 4, (40,) + shape).astype(np.float32):
+        median.add(value)
+        window.append(value)
+        if not save_all and len(window) > 6:
+            window.popleft()
+        np.testing.assert_array_equal(median.calculate(), np.median(np.array(window), axis=0))
+
+
+def test_rolling_median_sorted_array_blocks():
+    # столбцов больше, чем BLOCK: вставка и удаление идут по нескольким блокам
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 3, (4, 2, RollingMedianSortedArray.BLOCK)).astype(np.float32)
+    median = RollingMedianSortedArray(data, n_max=3)
+    window = deque(data[-3:])
+    for value in rng.integers(0, 3, (5, 2, RollingMedianSortedArray.BLOCK)).astype(np.float32):
+        median.add(value)
+        window.append(value)
+        window.popleft()
+        np.testing.assert_array_equal(median.calculate(), np.median(np.array(window), axis=0))
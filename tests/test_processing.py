@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from utils.processing import LowpassFilter, butter_sos
+
+
+@pytest.mark.parametrize("zero_phase", [False, True])
+def test_lowpass_filters_batch(zero_phase):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(3, 4, 200))        # [n_epochs x n_channels x n_samples]
+    lowpass = LowpassFilter(250, 5000, order=2, zero_phase=zero_phase)
+
+    y = lowpass(x)
+
+    sos = signal.butter(2, 250 / 5000 * 2, output='sos')
+    expected = signal.sosfiltfilt(sos, x, axis=-1) if zero_phase else signal.sosfilt(sos, x, axis=-1)
+    assert y.shape == x.shape
+    np.testing.assert_allclose(y, expected)
+
+
+def test_lowpass_stream_matches_single_pass():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(2, 300))
+    lowpass = LowpassFilter(250, 5000)
+
+    zi = lowpass.initial_state(x)
+    y1, zi = lowpass.stream(x[:, :100], zi)
+    y2, _ = lowpass.stream(x[:, 100:], zi)
+    y, _ = lowpass.stream(x, lowpass.initial_state(x))
+
+    np.testing.assert_allclose(np.concatenate([y1, y2], axis=-1), y)
+
+
+def test_butter_sos_cached_array_not_shared():
+    sos = butter_sos(2, 250, 5000)
+    sos[:] = 0
+    assert np.any(butter_sos(2, 250, 5000) != 0)
@@ -5,11 +5,18 @@ from PyQt5.QtGui import QFont, QFontMetrics
 from PyQt5.QtCore import Qt, pyqtSignal
 
 import numpy as np
+import os
 import pandas as pd
 
 from utils.ui_helpers import shortcut_scale, spin_box, fit_font_to_width_spinbox
 
 from widgets.teps_plot import TEPsPlot
+try:
+    from widgets.teps_plot_pg import TEPsPlotPG     # бэкенд на pyqtgraph (необязательная зависимость)
+    PG_IMPORT_ERROR = None
+except ImportError as e:
+    TEPsPlotPG = None
+    PG_IMPORT_ERROR = e                             # причина показывается при выборе бэкенда
 MICROVOLT = "\u03BC"+"V"
 
 class TEPsPanel(QFrame):
@@ -49,7 +56,7 @@ class TEPsPanel(QFrame):
         self.n_samples = self.ms_to_sample(self.params["SPEED"]["window_end"] - self.params["SPEED"]["window_start"])       # длина одной эпохи в сэмплах
         self.x_shift = self.ms_to_sample(0 - self.params["SPEED"]["window_start"])                                       # смещение относительно нуля для графиков в сэпмлах
 
-        filename = r".\resources\mumeg_mks64.ced"
+        filename = os.path.join("resources", "mumeg_mks64.ced")
         self.df_orig = pd.read_csv(filename, sep="\t")
 
         self.channels = self.df_orig.labels.values
@@ -91,8 +98,18 @@ class TEPsPanel(QFrame):
         text_height = QFontMetrics(font).height()
         self.label_record.setFixedSize(text_width, text_height)        # чтобы помещался текст с разным количеством эпох
 
+        self.label_latency = QLabel("", parent=self)                    # задержки обработки эпох (оверлей)
+        self.label_latency.setObjectName("label_latency")
+
         """Создаём полотно для графиков"""
-        self.figure = TEPsPlot(self, self._positions, single_w=self.plot_width, single_h=self.plot_height, w=self.width(), h=self.height(), channels=self.channels)
+        plot_class = TEPsPlot
+        if self.params["plot"]["backend"] == "pyqtgraph":
+            if TEPsPlotPG is None:
+                print(f"---> pyqtgraph недоступен ({PG_IMPORT_ERROR}), TEPs отрисовываются через matplotlib")
+            else:
+                plot_class = TEPsPlotPG
+        self.figure = plot_class(self, self._positions, single_w=self.plot_width, single_h=self.plot_height, w=self.width(), h=self.height(), channels=self.channels,
+                               decimate=self.params["plot"]["decimate"])
         
         self.figure.setAttribute(Qt.WA_TransparentForMouseEvents, True)                                               # делаем фигуру "прозрачной", чтобы она не перекрывала другие виджеты
     
@@ -103,6 +120,7 @@ class TEPsPanel(QFrame):
                                 # масштабирующие спинбоксы размещаем во время resize_event
         
         self.label_record.move(10, 10)
+        self.label_latency.move(10, 10 + self.label_record.height())
         
 
     # --- Сигналы ---
@@ -1,14 +1,12 @@
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal,  QEvent, QPoint
 from PyQt5.QtGui import QFont, QFontMetrics, QMouseEvent
-from PyQt5.QtWidgets import (QWidget, QGridLayout,QLabel, qApp, QFrame, QHBoxLayout, QSizePolicy, 
+from PyQt5.QtWidgets import (QWidget, QGridLayout,QLabel, QFrame, QHBoxLayout, QSizePolicy, 
                              QSplitter, QApplication, QFileDialog, QMessageBox)
 import numpy as np
 import pandas as pd
 
 import os
 import json
-import h5py
-from scipy import signal
 import time
 from datetime import datetime
 from collections import deque
@@ -20,12 +18,18 @@ from .TEP_suppl_plot_area import TEPsSupplPanel
 from .MEP_plot_area import MEPsPanel
 from .video_player import StimuliPresentation
 
-from utils.averaging_math import RollingMean, RollingMedian, RollingTrimMean
+from utils.averaging_math import AVERAGE_FUNCTIONS
+from utils.autosave import AutosaveWriter
+from utils.latency import monitor as latency
+from utils.render_scheduler import RenderScheduler
+from utils.processing import Baseline, LowpassFilter, SpatialFilter, TransformCache, car_matrix, rereference_matrix
+from utils.processing_worker import ProcessingWorker
+from utils.session_io import SessionReader, SummaryCache, session_summary
 from utils.concat_videos import concat_videos_by_order
 
 WIDTH_SET, HEIGHT_SET = 1850, 900  # параметры изначального окна интерфейса
 MICROVOLT = "\u03BC"+"V"
-filename = r".\resources\mumeg_mks64.ced"
+filename = os.path.join("resources", "mumeg_mks64.ced")
 df = pd.read_csv(filename, sep="\t")
 CHANNELS = df.labels.values
 
@@ -94,14 +98,15 @@ class MainWindow(QWidget):
     # --- Инициализация ---
     def _init_state(self):
         """Создаёт параметры и переменные"""
-        self._n_epoch = 0                                    # счётчик количества хранимых в памяти эпох
-        self._epochs = []                                   # список для хранения всех signle-trial TEPs
-        self.ts = []
+        self._n_epoch = 0                                    # счётчик количества хранимых в памяти эпох (по последнему кадру)
         self.EMG = deque(maxlen=5)
-        self.average_functions = []                         # список хранящий функции для расчёта средних
+        self._frame = None                                  # последний кадр от потока обработки (TEPs, MEP, n_epoch)
 
-        self._session_loaded = []                              # список с подгруженными датасетами
+        self._session_loaded = []                              # список с подгруженными датасетами (SessionReader - данные на диске)
         self._session_loaded_labels = []                       # список с названиями подгруженных файлов (для легенды)
+        self._session_summaries = []                           # TEPs/MEP для отрисовки сессий при текущих настройках
+        self._summary_cache = SummaryCache(max_items=self.params["session_cache"]["max_items"],   # сводки по (файл, настройки)
+                                           on_disk=self.params["session_cache"]["on_disk"])
 
         self.save_all = self.params["save_all"]             # флаг хранить ли все эпохи
         self.aver_method = self.params["aver_methods"][0]   # метод для усреднения эпох
@@ -112,19 +117,24 @@ class MainWindow(QWidget):
         if self.params["record"]["activate_bat"]:
             # Запуск батника с qml-файлом для управления резонансными модулями
             cwd = os.path.dirname(self.params["record"]["bat_file"]) # cwd = папка с батником
-            subprocess.Popen([self.params["record"]["bat_file"]], cwd=cwd)
+            try:
+                subprocess.Popen([self.params["record"]["bat_file"]], cwd=cwd)
+            except OSError as e:
+                print(f"---> Не удалось запустить {self.params['record']['bat_file']}: {e}")
 
         self._player_window = None
 
         self._average_data = True if self.params["curr_mode_idx"] == 0 else False           # 0 == "Усреднение" из  ["Усреднение", "Одиночные пробы"]
         self._process_new_data = True if self.params["curr_mode_data_idx"] == 0 else False  # 0 == "Новые данные" из ["Новые данные", "Сравнение"]
 
-        self.aver_empty_func = {                                        # dict с функциями для усреднения
-            "mean": lambda x, y, z: RollingMean(x, y, z), 
-            "median": lambda x, y, z: RollingMedian(x, y, z), 
-            "trimmean": lambda x, y, z: RollingTrimMean(x, y, z)
-        }
-        self._transform = lambda x: x
+        self.aver_empty_func = dict(AVERAGE_FUNCTIONS)                 # dict с функциями для усреднения
+        self._baseline = Baseline()                         # вычитание бейзлайна (по умолчанию выключено), копия для загруженных файлов
+
+        self._render = RenderScheduler(self.params["render"]["max_fps"], parent=self)   # отрисовка новых эпох не чаще max_fps
+        self._render.register("counter", self._update_label_counter)
+        self._render.register("plots", self._render_plots)
+        self._latency_key = None                            # таймстемп эпохи, для которой сейчас идёт отрисовка (для замеров задержек)
+        latency.enabled = self.params["latency"]["enabled"]
 
         self.specific_epoch = False                         # флаг для отслеживания режима показа определенной эпохи или стандартного
 
@@ -139,11 +149,52 @@ class MainWindow(QWidget):
         self.n_samples = self.ms_to_sample(self.SPEED["window_end"] - self.SPEED["window_start"])       # длина эпохи в сэмплах
         self.time_shift = self.ms_to_sample(0 - self.SPEED["window_start"])                             # смещение относительно нуля для графиков в сэпмлах
 
-        # --- создать и открыть файл для автоматической записи получаемых данных ---
+        params = self.params["MEP_plot"]                                                                # окно размаха MEP (отсчёты эпохи) для сохраняемых файлов
+        self._mep_window = (self.time_shift + self.ms_to_sample(params["amp_start_ms"]),
+                            self.time_shift + self.ms_to_sample(params["amp_end_ms"]))
+
+        # поток обработки: хранилище эпох, цепочка преобразований с кэшем стадий, усреднение TEPs и MEP
+        params = self.params["processing"]
+        self._worker = ProcessingWorker(n_channels=len(CHANNELS), n_samples=self.n_samples,
+                                        average_functions=self.aver_empty_func,
+                                        queue_size=params["queue_size"], policy=params["policy"],
+                                        publish_interval=1 / self.params["render"]["max_fps"],
+                                        max_cache_bytes=self.params["transform_cache_mb"] * 2**20,
+                                        mep_window=self._mep_window)
+        self._worker.frame_ready.connect(self._on_frame)
+        self._worker.epoch_ready.connect(self._on_epoch_ready)
+        self._worker.start()
+
+        # своя цепочка преобразований для загруженных файлов: настройки меняются здесь сразу,
+        # а в потоке обработки - только когда до команды дойдёт очередь
+        self._spatial_filter = SpatialFilter(stages=("CAR", "rereference"))
+        identity = lambda x: x
+        self._session_pipeline = TransformCache(source=None,
+                                                stages=[("lowpass", identity),
+                                                        ("baseline", identity),
+                                                        ("spatial", self._spatial_filter.apply)],
+                                                n_channels=len(CHANNELS), n_samples=self.n_samples)
+        self._transform = self._session_pipeline.transform  # вся цепочка без кэширования (для загруженных файлов)
+
+        # --- фоновая автоматическая запись получаемых данных в файл ---
+        params = self.params["autosave"]
         cur_time = datetime.now().strftime("%Y.%m.%d_%H.%M")
-        self.autosave_file = h5py.File(os.path.join("data/autosave", f"{cur_time}.h5"), "w")
-        self.dset = self.autosave_file.create_dataset("epochs", (0, 66), maxshape=(None, 66), dtype='float32')  # для эпох (64 EEG + 2 EMG)
-        self.tset = self.autosave_file.create_dataset("timestamps", (0, ), maxshape=(None, ), dtype='int64')    # для таймстемпов резонанса (в нс)
+        self._autosave = AutosaveWriter(os.path.join(params["folder"], f"{cur_time}.h5"),
+                                        n_channels=66, n_samples=self.n_samples, Fs=self.SPEED["Fs"],
+                                        queue_size=params["queue_size"],
+                                        batch_size=params["batch_size"],
+                                        flush_interval=params["flush_interval_s"],
+                                        compression=params["compression"],
+                                        storage=params["storage"],
+                                        full_scale_uV=np.r_[np.full(64, params["full_scale_uV"]["EEG"]),
+                                                            np.full(2, params["full_scale_uV"]["EMG"])],
+                                        mep_window=self._mep_window)
+        try:
+            self._autosave.start()      # файл создаётся здесь: ошибка открытия видна сразу
+            self.dispatcher.subscribe("autosave", self._save_data)     # отдельный подписчик: запись не задерживает обработку
+        except Exception as e:
+            print(f"---> Autosave не запущен: {e}")
+            QMessageBox.warning(self, "Autosave", f"Автозапись не запущена:\n{e}")
 
     # --- UI ---
     def _setup_ui(self):
@@ -256,98 +307,101 @@ class MainWindow(QWidget):
 
     # --- Логика ---
     def _get_data(self, msg, timestamp):
-        # если режим обработки новых данных
+        # вызывается в потоке драйвера: только постановка эпохи в очередь обработки
         if self._process_new_data:
-            self._save_data(msg, timestamp)     # сохранить новые данные
-            
-            self._n_epoch += 1                   # обновить счётчик количества эпох
-            self._update_label_counter(self._n_epoch)
+            with latency.span("_get_data", timestamp):
+                self._worker.submit_epoch(msg, timestamp)       # msg: [n_samples x n_channels]
 
-            # распаковать "сообщение" в формате {"TEPs": list of EEG data in microvolt} 
-            # data = np.array(json.loads(msg)["TEPs"]).T  # [n_channels x n_samples]
-            
-            data = np.array(msg).T          # [n_channels x n_samples], n_channels = EEG_channels + 2 EMG_channels
-
-            self._epochs.append(data)        # добавить в список хранимых эпох -> [n_epoch x n_channels x n_samples]
-            self.ts.append(timestamp)       # только для сохранения таймстемпов резонанса в файлы
-
-            if self._average_data:                    # если режим усреднения, обновить функции усреднения
-                TEPs = data[:-2, :] * 10**6           # выделить только TEPs и преобразовать в мкВ
-                TEPs2plot = self._transform(TEPs)     # нужные преобразования -> [n_channels x n_samples]
-                self._update_average_functions(TEPs2plot)
-
-            self._update_plots()
-    
-    def _update_average_functions(self, TEPs):
-        """обновление функций данными новой эпохи"""
-        for i, ch_data in enumerate(TEPs):
-            avg_funcs = self.average_functions[i]
-            for j in range(len(avg_funcs)):                    
-                avg_funcs[j].add(ch_data[j])        # обновить сохранённые функции усреднения
-    
-    def _calculate_avg_TEP(self):
-        data_aver = []
-        for avg_funcs in self.average_functions:
-            average_TEPs = [f.calculate() for f in avg_funcs]  # усреднённые TEPs
-            data_aver.append(average_TEPs)
-        return  np.array(data_aver)
+    def _on_frame(self, frame):
+        """новый кадр от потока обработки (в GUI-потоке): отрисовка - по таймеру, пачка кадров -> одна перерисовка"""
+        self._frame = frame
+        self._n_epoch = frame["n_epoch"]
+        if self._process_new_data:
+            self._render.mark_dirty("counter", n_epoch=self._n_epoch)
+            if not self.specific_epoch:     # показ отдельной эпохи: кадр сохраняется, отрисуется при возврате (_update_data)
+                self._render.mark_dirty("plots")
+
+    def _on_epoch_ready(self, TEPs):
+        self._render.cancel("plots")                            # кадр, пришедший до запроса, не должен перекрыть эпоху
+        self._update_plots(update_emg=False, TEPs2plot=TEPs)   # отобразить заданную эпоху
+
+    def _render_plots(self):
+        if not self._process_new_data:
+            return
+        if self._n_epoch == 0:              # эпохи удалены
+            self._restart_plots()
+            return
+        self._latency_key = self._frame["timestamp"]
+        self._update_plots()
+        self._latency_key = None
+        latency.finish(self._frame["timestamp"])    # эпоха отрисована: полная задержка от прихода в драйвер
     
-    def _update_plots(self, update_emg=True): 
+    def _averaging_settings(self):
+        """настройки усреднения для потока обработки (None - режим одиночных проб)"""
+        return (self.aver_method, self.n_aver_max, self.aver_all) if self._average_data else None
+
+    def _update_worker(self, func, *args):
+        """выполнить команду в потоке обработки (кадр с результатом придёт сам) и перерисовать загруженные данные
+
+        Загруженные файлы обрабатываются своей цепочкой (_session_pipeline), которую обработчик
+        настройки обновляет до вызова, поэтому перерисовка не ждёт поток обработки.
+        """
+        self._worker.submit(func, *args)
+        if not self._process_new_data:
+            self._update_data()
+
+    def _update_plots(self, update_emg=True, TEPs2plot=None): 
         """TEPs"""
-        if self._average_data:
-            TEPs2plot = self._calculate_avg_TEP()
-        else:
-            TEPs = self._epochs[-1][:-2, :] * 10**6          # выделить только TEPs и преобразовать в мкВ
-            TEPs2plot = self._transform(TEPs)               # нужные преобразования -> [n_channels x n_samples]
+        if TEPs2plot is None:
+            TEPs2plot = self._frame["TEPs"]                 # среднее или последняя эпоха после всех преобразований -> [n_channels x n_samples]
         
-        self.main_teps_panel.figure.update_data(TEPs2plot)          # отобразить TEPs (центральные графики)
+        with latency.span("TEPsPlot.update_data", self._latency_key):
+            self.main_teps_panel.figure.update_data(TEPs2plot)          # отобразить TEPs (центральные графики)
         self.suppl_teps_panel.figure_TEP.update_TEPs(TEPs2plot)     # отобразить TEPs (усреднённый график)
         
         if self.params["TEP_suppl_plot"]["topoplot"]["draw"]:
             timestamps = self.params["TEP_suppl_plot"]["timestamps_ms"]
-            for i, t_ms in enumerate(timestamps):
-                t = self.ms_to_sample(t_ms)
-                self.suppl_teps_panel.figure_topo[i].plot_topomap(TEPs2plot[:, t])
+            with latency.span("topoplots", self._latency_key):
+                for i, t_ms in enumerate(timestamps):
+                    t = self.ms_to_sample(t_ms)
+                    self.suppl_teps_panel.figure_topo[i].plot_topomap(TEPs2plot[:, t])
         
         """MEPs"""
         if update_emg:
-            emg = self._baseline(self._epochs[-1][-2:, :] * 1E3)  # вычесть бейзлайн и перевести в мВ
-            emg = np.diff(emg, axis=0).flatten()                # посчитать разницу каналов
+            emg = self._frame["emg"]
 
             x_min, x_max = self.ms_to_sample(self.params["MEP_plot"]["xmin_ms"]), self.ms_to_sample(self.params["MEP_plot"]["xmax_ms"])
             emg2plot = emg[self.time_shift+x_min:self.time_shift+x_max] 
 
-            self.meps_panel.figure.update_emg(emg2plot)
+            with latency.span("MEPPlot.update_emg", self._latency_key):
+                self.meps_panel.figure.update_emg(emg2plot)
 
-            emg_epochs = np.array(self._epochs)[:, -2:] * 10**3
-            emg = np.mean(np.array([np.diff(self._baseline(emg), axis=0).flatten() for emg in emg_epochs]), axis=0)
-            self.suppl_teps_panel.figure_MEP.update_MEPs(emg)
+            self.suppl_teps_panel.figure_MEP.update_MEPs(self._frame["mep_average"])
     
     def _update_data(self):
+        self._render.cancel("plots")    # всё перерисовывается сейчас - отложенный кадр не нужен
         self._restart_plots()
         # если есть что нарисовать и режим отображения "новых данных"
         if self._n_epoch > 0 and self._process_new_data:
-            self._update_plots()
+            self._update_plots()                            # последний кадр от потока обработки
         # если есть что нарисовать и режим отобраения "загруженных данных"
         if len(self._session_loaded) != 0 and not self._process_new_data:
             self._draw_loaded_data()
 
-    def _draw_loaded_data(self):
-        TEPs_sessions = []
-        MEPs_sessions = []
-        for data in self._session_loaded:
-            if self._average_data:
-                self._create_average_functions(data)
-                TEPs2plot = self._calculate_avg_TEP()         # -> [n_channels x n_samples]    units=[uV]
-            else:
-                TEPs = data[-1][:-2, :] * 1E6         # выделить только одну последнюю эпоху с TEPs и преобразовать в мкВ
-                TEPs2plot = self._transform(TEPs)             # нужные преобразования -> [n_channels x n_samples]   units=[uV]
-            TEPs_sessions.append(TEPs2plot)
+    def _summarize_sessions(self):
+        """TEPs (среднее или последняя эпоха) и средний MEP каждой сессии - потоковым проходом по файлам"""
+        function = self.aver_empty_func[self.aver_method] if self._average_data else None
+        params = (self._session_pipeline.key(), self._baseline.key, self._averaging_settings())
+        compute = lambda reader: session_summary(reader, self._transform, self._baseline, function,
+                                                 self.n_aver_max, self.aver_all,
+                                                 chunk_epochs=self.params["session_chunk_epochs"])
+        self._session_summaries = [self._summary_cache.get(reader, params, lambda: compute(reader))
+                                   for reader in self._session_loaded]
 
-            emg_epochs = data[:, -2:, :] * 1E3        # -> [n_epoch x 2 x n_samples]    units=[mV]
-            emg_epochs = np.array([np.diff(self._baseline(emg), axis=0).flatten() for emg in emg_epochs])    # -> [n_epoch x 1 x n_samples]    
-            emg = np.mean(emg_epochs, axis=0)         # усреднённые по эпохам [1 x n_samples]
-            MEPs_sessions.append(emg)
+    def _draw_loaded_data(self):
+        self._summarize_sessions()
+        TEPs_sessions = [summary["TEPs"] for summary in self._session_summaries]    # [n_channels x n_samples]    units=[uV]
+        MEPs_sessions = [summary["MEP"] for summary in self._session_summaries]     # [n_samples]    units=[mV]
 
         # отобразить TEPs на центральном графике в режиме сравнения
         self.main_teps_panel.figure.draw_loaded_TEPs(TEPs_sessions, self._session_loaded_labels)
@@ -361,9 +415,9 @@ class MainWindow(QWidget):
                 timestamps = self.params["TEP_suppl_plot"]["timestamps_ms"]
                 for i, t_ms in enumerate(timestamps):
                     t = self.ms_to_sample(t_ms)
-                    self.suppl_teps_panel.figure_topo[i].plot_topomap(TEPs_sessions[0][:, t])
+                    self.suppl_teps_panel.figure_topo[i].plot_topomap(TEPs_sessions[0][:, t], contours=True)
                     
-            self._update_label_counter(self._session_loaded[0].shape[0])
+            self._update_label_counter(len(self._session_loaded[0]))
 
         else:   # если загружено несколько файлов
             self.suppl_teps_panel.figure_TEP.draw_loaded_multiple_sessions(TEPs_sessions, signal="TEP")
@@ -372,12 +426,8 @@ class MainWindow(QWidget):
             self._update_label_counter("")
 
     def _save_data(self, epoch, ts):
-        n = self.dset.shape[0]
-        self.dset.resize(n + epoch.shape[0], axis=0)
-        self.dset[n:] = epoch
- 
-        self.tset.resize(self.tset.shape[0] + 1, axis=0)
-        self.tset[-1] = ts
+        if self._process_new_data:
+            self._autosave.put(epoch, ts)       # запись на диск идёт в отдельном потоке
 
     def _on_button_save_click(self):
         # открытие диалога для выбора названия и места хранения файла
@@ -393,22 +443,14 @@ class MainWindow(QWidget):
             print("---> Сохранение отменено")
             return None 
         
-        data2save = np.array(self._epochs[:]).transpose(0, 2, 1).reshape(-1, 66)      # (n_samples, n_channels)
-        ts2save = np.array(self.ts)
-        # если выбран файл
-        with h5py.File(file_path, "w") as h5f:
-            data = h5f.create_dataset("epochs", data=data2save, dtype='float32')      # для эпох (64 EEG + 2 EMG)
-            data.attrs["Fs"] = self.SPEED["Fs"]
-            data.attrs["n_samples"] = self.n_samples
-            data.attrs["n_epochs"] = len(self._epochs)
-            
-            tdata = h5f.create_dataset("timestamps", data=ts2save, dtype='int64')      # для таймстемпов резонанса (в нс)
-            tdata.attrs["units"] = "ns"
+        # если выбран файл - записать в потоке обработки (там хранятся эпохи)
+        self._worker.submit(self._worker.save, file_path, self.SPEED["Fs"])
 
     def _on_button_load_click(self):
         # очистить стек подгруженных данных
         self._session_loaded = []
         self._session_loaded_labels = []
+        self._session_summaries = []
 
         # открыть диалог для выбора файла/файлов
         paths, _ = QFileDialog.getOpenFileNames(
@@ -423,21 +465,20 @@ class MainWindow(QWidget):
             print("---> Подгрузка файлов отменена")
             return None  
         
-        # если выбран файл/файлы - загрузить в память данные
+        # если выбран файл/файлы - открыть (в память читаются только метаданные, эпохи - пачками при отрисовке)
         for file_path in paths:
-            with h5py.File(file_path, "r") as h5f:
-                stream = h5f['epochs'][:]
-                n_epochs = h5f['epochs'].attrs["n_epochs"]
-                n_samples = h5f['epochs'].attrs["n_samples"]
+            reader = SessionReader(file_path, n_samples=self.n_samples)     # длина эпохи - для ранних autosave без атрибутов
+            if len(reader) == 0:        # например, автосохранение, закрытое до первой эпохи
+                print(f"---> {reader.name}: в файле нет эпох, файл пропущен")
+                continue
+            self._session_loaded.append(reader)
+            self._session_loaded_labels.append(reader.name)
 
-                epochs =  stream.reshape((n_epochs, n_samples, stream.shape[1])).transpose(0, 2, 1) # -> [n_epochs, n_channels, n_samples]
-                self._session_loaded.append(epochs)
+            print(f"> {reader.name} : n_epoch = {len(reader)} <")
 
-                name = os.path.splitext(os.path.basename(file_path))[0] # имя файла без разрешения
-                self._session_loaded_labels.append(name)
+        if not self._session_loaded:
+            return None
 
-                print(f"> {name} : n_epoch = {n_epochs} <")
-        
         # self._update_label_counter(self._n_epoch)
         self._draw_loaded_data()
 
@@ -445,9 +486,7 @@ class MainWindow(QWidget):
         self._n_epoch = 0
         self._update_label_counter(0)
 
-        self._epochs = []
-        self.ts = []
-        self._create_average_functions()
+        self._worker.submit(self._worker.clear)
 
         self._restart_plots()
     
@@ -524,34 +563,19 @@ class MainWindow(QWidget):
             self.settings_panel.button_show_epoch.setText("Показать эпоху")
         else:                   # если не был включён режим показа отдельной эпохи - показать её
             n_show = self.settings_panel.spin_box_show_epoch.value()    # номер эпохи для просмотра
-            data = self._transform(np.array(self._epochs[n_show-1])[:-2, :])
-            self._update_plots(data)
+            self._worker.submit(self._worker.publish_epoch, n_show-1, publish=False)   # эпоха придёт в _on_epoch_ready
             self.settings_panel.button_show_epoch.setText("Стандартный режим")
             
         self.specific_epoch = not self.specific_epoch
 
     def _on_remove_epoch_button_click(self):  
-        self._n_epoch -= 1
-        self._update_label_counter(self._n_epoch)
-
         n_delete = self.settings_panel.spin_box_remove_epoch.value()    # номер эпохи для удаления 
 
-        del self._epochs[n_delete-1]                     # минус один для учёта нумерации с нуля
-
-        if self._average_data:
-            self._create_average_functions()
-        if self._n_epoch > 0:
-            self._update_data()
-        else:
-            self._restart_plots()
+        self._worker.submit(self._worker.remove, n_delete-1)     # минус один для учёта нумерации с нуля; счётчик и графики - по новому кадру
 
     def _on_update_averaging_button_click(self):
         """применение настроек для усреднения эпох"""
-        if self._average_data and self._process_new_data:         # если режим усреднения
-            data = self._epochs if self._n_epoch > 0 else None
-            self._create_average_functions(data)            # создать новые функции
-
-        self._update_data()                     # отобразить изменения
+        self._update_worker(self._worker.set_averaging, self._averaging_settings())     # создать новые функции
 
     def _on_update_baseline_button_click(self):
         apply_baseline = self.settings_panel.check_box_baseline.isChecked()   # вычитать ли бейзлайн
@@ -561,106 +585,54 @@ class MainWindow(QWidget):
             ind_start = self.ms_to_sample(baseline_start - self.SPEED["window_start"])
             ind_end = ind_start + self.ms_to_sample(baseline_end - baseline_start) + 1
             mean_function = self.settings_panel.combo_box_baseline.currentText()
-            func = (lambda x: np.mean(x, axis=1)) if mean_function == 'mean' else (lambda x: np.median(x, axis=1))
-            calculate_baseline = lambda x: func(x[:, ind_start:ind_end]).reshape((-1, 1))
-        
-        self._baseline = (lambda x: x - calculate_baseline(x)) if apply_baseline else (lambda x: x)
-        # если усреднять и уже есть данные - создать новые функции
-        if self._average_data and self._n_epoch > 0 and self._process_new_data:  
-            self._create_average_functions(self._epochs)
-        
-        self._update_data()         # отобразить изменения
+            self._baseline = Baseline(ind_start, ind_end, mean_function)   # по времени, для эпохи и пачки эпох
+        else:
+            self._baseline = Baseline()
+        self._session_pipeline.set_stage("baseline", self._baseline)
+        self._update_worker(self._worker.set_baseline, self._baseline)   # смещения эпох, средний MEP и средние TEPs пересчитываются
     
     def _on_update_lowpass_button_click(self):
         apply_filter = self.settings_panel.check_box_lowpass.isChecked()
+        lowpass_filter = lambda x: x
         if apply_filter:
             f = self.settings_panel.spin_box_lowpass.value()
-            sos_lowpass = signal.butter(2, f/self.SPEED["Fs"]*2, btype='lowpass', output='sos')
-        self._lowpass_filter = (lambda x: signal.sosfilt(sos_lowpass, x, axis=0)) if apply_filter else (lambda x: x)    
-        # если усреднять и уже есть данные - создать новые функции
-        if self._average_data and self._n_epoch > 0 and self._process_new_data:  
-            self._create_average_functions(self._epochs)
-        
-        self._update_data()         # отобразить изменения
+            lowpass_filter = LowpassFilter(f, self.SPEED["Fs"], order=2,              # фильтрация по времени сразу всех эпох и каналов
+                                           zero_phase=self.params["lowpass_zero_phase"])
+        self._session_pipeline.set_stage("lowpass", lowpass_filter)
+        self._update_worker(self._worker.set_lowpass, lowpass_filter)
 
     def _on_update_rereference_button_click(self):
         apply_reref = self.settings_panel.check_box_rereference.isChecked()
         reref_channel = self.settings_panel.combo_box_rereference.checkedItems()[0] # канал для ререферентации
         idx = np.where(CHANNELS == reref_channel)[0][0] # индекс канала для ререферентации
 
-        n_channels = len(CHANNELS)  
-        e_r = np.zeros((n_channels, 1)); 
-        e_r[idx, 0] = 1.0
-        R = np.eye(n_channels) - np.ones((n_channels, 1)) @ e_r.T
-
-        self._referef = (lambda x: R @ x) if apply_reref else (lambda x: x)
-        # если усреднять и уже есть данные - создать новые функции
-        if self._average_data and self._n_epoch > 0 and self._process_new_data:  
-            self._create_average_functions(self._epochs)
-        
-        self._update_data()         # отобразить изменения
+        R = rereference_matrix(len(CHANNELS), idx) if apply_reref else None
+        self._spatial_filter.set_stage("rereference", R)
+        self._update_worker(self._worker.set_spatial, "rereference", R)  # пересчёт только пространственной стадии
 
     def _on_update_CAR_button_click(self):
         apply_CAR = self.settings_panel.check_box_car.isChecked()   # применять ли CAR
+        W = None
         if apply_CAR: 
             CAR_channels = self.settings_panel.combo_box_channels.checkedItems()
-            n_sel = len(CAR_channels)
-            if n_sel == 0:
-                raise ValueError("Не отмечены каналы для построения CAR фильтра.")
             is_selected = np.array([ch in CAR_channels for ch in CHANNELS])
-            n_channels = len(CHANNELS)
-            W = np.eye(n_channels) - (1/n_sel) * np.outer(np.ones(n_channels), is_selected.astype(float)) # матрица фильтра CAR                 
-        self._CAR = (lambda x: W @ x) if apply_CAR else (lambda x: x)           # функция для вычисления CAR
-        # если усреднять и уже есть данные - создать новые функции
-        if self._average_data and self._n_epoch > 0 and self._process_new_data:  
-            self._create_average_functions(self._epochs)
-        
-        self._update_data()         # отобразить изменения
-
-    def _create_full_transform(self):
-        self._transform = lambda x: self._referef(
-            self._CAR(
-                self._baseline(
-                    self._lowpass_filter(
-                        x
-                        )
-                    )
-                )
-            )
-
-    def _create_average_functions(self, new_data=None):
-        """Создать функции для усреднения TEPs"""
-        function = self.aver_empty_func[self.aver_method]   # пустой трафарет
-        if new_data is not None:
-            data = np.array([self._transform(np.array(TEPs[:-2, :], dtype=float) * 1E6) for TEPs in new_data])
-            self.average_functions = [
-                [function(data[:, i, j], self.n_aver_max, self.aver_all)
-                for j in range(self.n_samples)]
-                for i in range(len(CHANNELS))
-            ]
-        else:
-            self.average_functions = [
-                [function([], self.n_aver_max, self.aver_all)
-                for _ in range(self.n_samples)]
-                for _ in range(len(CHANNELS))
-            ]
+            W = car_matrix(is_selected)                     # матрица фильтра CAR
+        self._spatial_filter.set_stage("CAR", W)
+        self._update_worker(self._worker.set_spatial, "CAR", W)          # пересчёт только пространственной стадии
 
     def _on_change_mode(self, idx):
         self._average_data = True if idx == 0 else False      # из  ["Усреднение", "Одиночные пробы"]
-        if self._average_data:
-            self._create_average_functions()    # обновить функции усреднения
-        self._update_data() # отобразить изменения
+        self._update_worker(self._worker.set_averaging, self._averaging_settings())   # обновить функции усреднения
 
     def _on_change_mode_data(self, idx):        
         self._process_new_data = True if idx == 0 else False  # из ["Новые данные", "Сравнение"]
 
         self._session_loaded = []                              # список с подгруженными датасетами
         self._session_loaded_labels = []                       # список с названиями подгруженных файлов (для легенды)
+        self._session_summaries = []
 
-        if self._average_data:
-            data = self._epochs if self._process_new_data and self._n_epoch > 0 else None
-            self._create_average_functions(data)    # обновить функции усреднения
-
+        if self._process_new_data:                  # счётчик новых эпох мог не обновляться в режиме сравнения
+            self._update_label_counter(self._n_epoch)
         self._update_data()                         # отобразить изменения
 
     def _restart_plots(self):
@@ -679,6 +651,23 @@ class MainWindow(QWidget):
 
         self.suppl_teps_panel.figure_TEP.draw_rectangle(xmin_ms, xmax_ms, ymin, ymax)
 
+    def _update_latency_overlay(self):
+        label = self.main_teps_panel.label_latency
+        label.setText(latency.overlay_text(["total", "driver", "transform", "averaging",
+                                            "TEPsPlot.update_data", "topoplots", "MEPPlot.update_emg"]))
+        label.adjustSize()
+
+    def _export_latency(self, dispatcher_stats):
+        folder = self.params["latency"]["export_folder"]
+        if not folder or not latency.summary():
+            return
+        os.makedirs(folder, exist_ok=True)
+        cur_time = datetime.now().strftime("%Y.%m.%d_%H.%M")
+        latency.export_csv(os.path.join(folder, f"{cur_time}_latency.csv"))
+        latency.export_json(os.path.join(folder, f"{cur_time}_latency.json"))
+        with open(os.path.join(folder, f"{cur_time}_dispatcher.json"), "w") as f:   # время обработки по подписчикам потока
+            json.dump(dispatcher_stats, f, indent=2)
+
     def _initial_calculations(self):
         t0 = time.perf_counter()
 
@@ -688,14 +677,11 @@ class MainWindow(QWidget):
         self._on_update_rereference_button_click()
         self._on_update_averaging_button_click()
 
-        self._create_full_transform()
-
         t5 = time.perf_counter()
         print(f"все предварительные рассчёты: {t5 - t0:.6f} сек")
     
     def _update_label_counter(self, n_epoch):
         self.main_teps_panel.label_n_epoch.setText('Количество эпох: {}'.format(n_epoch))
-        qApp.processEvents()    # для обновления отображения в Qt-приложении
 
         # если эпохи есть, то разрешить их очистку из памяти по нажатию кнопки 
         
@@ -716,41 +702,19 @@ class MainWindow(QWidget):
         plot = False
         if self.params["TEP_suppl_plot"]["topoplot"]["draw"]:
             if self._process_new_data:
-                plot = (len(self._epochs) != 0)
-                if not self._average_data:
-                    data2plot = self._transform(self._epochs[-1, :-2]*10**6)
-                else:
-                    data_aver = []
-                    for i in range(len(CHANNELS)):
-                        average_TEPs = np.array([f.calculate() for f in self.average_functions[i]])  # усреднённые TEPs
-                        data_aver.append(average_TEPs)
-                    data2plot = np.array(data_aver)
+                plot = (self._n_epoch != 0)
+                if plot:
+                    data2plot = [self._frame["TEPs"]]            # усреднённые TEPs или последняя эпоха
             else:
-                
-                function = self.aver_empty_func[self.aver_method]
-                data2plot = []
-                plot = (len(self._data_loaded) != 0)
-                for data_raw in self._data_loaded:
-                    if not self._average_data:
-                        data2plot.append(self._transform(data_raw[-1, :-2]*10**6))     # последняя эпоха
-                    else:
-                        data = np.array([self._transform(np.array(TEPs[:-2, :]*10**6, dtype=float)) for TEPs in data_raw])
-                        data_aver = []
-
-                        for i in range(len(CHANNELS)):
-                            average_functions = [function(data[:, i, j], self.n_aver_max, self.aver_all)
-                                for j in range(self.n_samples)
-                            ]
-                            average_TEPs = np.array([f.calculate() for f in average_functions])  # усреднённые TEPs
-                            data_aver.append(average_TEPs)
-                        data2plot.append(np.array(data_aver))
+                plot = (len(self._session_summaries) != 0)
+                data2plot = [summary["TEPs"] for summary in self._session_summaries]   # уже посчитаны при отрисовке сессий
         if plot:
             for i in range(3):
                 ts = self.suppl_teps_panel.spinbox_ts[i].value()
                 t = self.ms_to_sample(ts)
                 print(t, ts)
                 
-                self.suppl_teps_panel.figure_topo[i].plot_topomap(data2plot[0][:, t])
+                self.suppl_teps_panel.figure_topo[i].plot_topomap(data2plot[0][:, t], contours=True)
 
     # --- Финализация ---
     def _post_init(self):
@@ -759,6 +723,11 @@ class MainWindow(QWidget):
 
         self._on_change_main_scale()
 
+        if self.params["latency"]["enabled"] and self.params["latency"]["overlay"]:
+            self._latency_timer = QTimer(self)          # обновление оверлея с задержками
+            self._latency_timer.timeout.connect(self._update_latency_overlay)
+            self._latency_timer.start(self.params["latency"]["overlay_interval_ms"])
+
         # self.setWindowTitle("Demo App")
         # self.resize(400, 200)
         self.show()
@@ -805,15 +774,11 @@ class MainWindow(QWidget):
         return super().eventFilter(obj, event)
     
     def closeEvent(self, event):
-        try:
-            n = self.tset.shape[0]
-            file_path = self.autosave_file.filename
-            self.autosave_file.close()
-            if n == 0:      # удалить, если ничего не было сохранено
-                os.remove(file_path)
-            print("---> Autofile закрыт корректно.")
-        except Exception as e:
-            print(f"---> Ошибка закрытия autofile: {e}")
+        stats = self.dispatcher.stats()
+        self.dispatcher.reset()     # отписаться от входящего потока
+        self._worker.stop()         # обработать уже поставленные эпохи и команды, остановить поток
+        self._autosave.close()      # дописать очередь и закрыть файл (пустой файл удаляется)
+        self._export_latency(stats) # сохранить замеры задержек (csv + json) и статистику подписчиков
 
         event.accept()
 
@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from utils.session_io import SessionWriter, int16_scale
+
+
+class AutosaveWriter(threading.Thread):
+    """Фоновая автозапись эпох в HDF5.
+
+    Эпохи попадают в ограниченную очередь и записываются отдельным потоком пачками
+    (один resize на пачку) в формате SessionWriter, файл сбрасывается на диск не реже чем
+    раз в flush_interval секунд.
+    Если диск не успевает и очередь переполнена - новые эпохи отбрасываются, а не блокируют GUI.
+    Файл создаётся в start() (в вызывающем потоке), поэтому ошибки открытия получает вызывающий.
+    Ошибка записи останавливает поток: она сохраняется в error, и put() сообщает о ней.
+    storage='int16' - компактная запись с фиксированным шагом по каналам из full_scale_uV
+    (диапазон +-full_scale_uV, скаляр или [n_channels]).
+    mep_window - окно (отсчёты эпохи) для размаха MEP в meta/mep_amplitude.
+    """
+    def __init__(self, file_path, n_channels=66, n_samples=None, Fs=None, queue_size=256, batch_size=8,
+                 flush_interval=2.0, compression=None, storage="float32", full_scale_uV=None, mep_window=None):
+        super().__init__(name="autosave", daemon=True)
+
+        self.file_path = file_path
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.Fs = Fs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compression = compression
+        self.storage = storage
+        self.scale = int16_scale(full_scale_uV) if storage == "int16" else None
+        self.mep_window = mep_window
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._sentinel = object()       # маркер завершения работы потока
+        self._writer = None
+        self.error = None               # исключение, остановившее запись
+
+        self.n_written = 0          # сколько эпох записано в файл
+        self.n_dropped = 0          # сколько эпох отброшено из-за переполнения очереди
+
+    def start(self):
+        folder = os.path.dirname(self.file_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._writer = SessionWriter(self.file_path, self.n_channels, self.n_samples, self.Fs, self.compression,
+                                     self.storage, self.scale, mep_window=self.mep_window)
+        super().start()
+
+    def put(self, epoch, timestamp):
+        # epoch: [n_samples x n_channels] (как приходит из резонанса), копируется - буфер драйвера переиспользуется
+        if self.error is not None:
+            self.n_dropped += 1
+            if self.n_dropped == 1:         # одно сообщение, а не по сообщению на эпоху
+                print(f"---> Autosave остановлен: {self.error!r}. Эпохи не записываются")
+            return
+        try:
+            self._queue.put_nowait((np.array(epoch, dtype=np.float32).T, timestamp))    # -> [n_channels x n_samples]
+        except queue.Full:
+            self.n_dropped += 1
+            print(f"---> Autosave не успевает: эпоха отброшена (всего {self.n_dropped})")
+
+    def close(self):
+        """дописать очередь, закрыть файл и удалить его, если ничего не было сохранено"""
+        if self.is_alive():
+            self._queue.put(self._sentinel)
+            self.join()
+
+    def run(self):
+        try:
+            with self._writer as writer:
+                self._loop(writer)
+            if writer.n_clipped:
+                print(f"---> Autofile: {writer.n_clipped} отсчётов вне диапазона int16 обрезаны")
+            if self.n_written == 0:     # удалить, если ничего не было сохранено
+                os.remove(self.file_path)
+            print("---> Autofile закрыт корректно.")
+        except Exception as e:
+            self.error = e
+            print(f"---> Ошибка autofile, автозапись остановлена: {e}")
+
+    def _loop(self, writer):
+        batch = []
+        last_flush = time.monotonic()
+        stop = False
+        while not stop:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is self._sentinel:
+                    stop = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+
+            # дозабрать то, что уже лежит в очереди, чтобы писать пачкой
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._sentinel:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if batch and (len(batch) >= self.batch_size or due or stop):
+                self._write(writer, batch)
+                batch = []
+            if due or stop:
+                writer.flush()
+                last_flush = time.monotonic()
+
+    def _write(self, writer, batch):
+        epochs = np.stack([epoch for epoch, _ in batch])        # -> [n_batch x n_channels x n_samples]
+        timestamps = np.array([ts for _, ts in batch], dtype=np.int64)
+        writer.append(epochs, timestamps)
+        self.n_written += len(batch)
@@ -2,6 +2,10 @@ import bisect
 from collections import deque
 import copy
 import logging
+import math
+import random
+
+import numpy as np
 
 
 
@@ -86,3 +90,354 @@ class RollingTrimMean:
         return round(sum(trimmed) / len(trimmed), 2)
     
 
+
+
+class _SkiplistNode:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value, next, width):
+        self.value, self.next, self.width = value, next, width
+
+
+_NIL = _SkiplistNode(math.inf, [], [])     # конец списка на всех уровнях
+
+
+class IndexableSkiplist:
+    """Отсортированный список: вставка, удаление и доступ по индексу за O(log n) в среднем.
+
+    На каждом уровне хранится ширина ссылки (сколько элементов она перепрыгивает),
+    поэтому i-й по порядку элемент ищется так же, как значение.
+    values должны быть уже отсортированы - список строится за O(n) без поиска.
+    """
+    def __init__(self, expected_size=1024, values=()):
+        self.max_levels = 1 + int(math.log(max(2, expected_size), 2))
+        self.head = _SkiplistNode(None, [_NIL] * self.max_levels, [1] * self.max_levels)
+        self.size = 0
+
+        last = [self.head] * self.max_levels        # последний узел на каждом уровне и его позиция (head = 0)
+        last_pos = [0] * self.max_levels
+        for pos, value in enumerate(values, start=1):
+            d = self._random_level()
+            node = _SkiplistNode(value, [_NIL] * d, [0] * d)
+            for level in range(d):
+                last[level].next[level] = node
+                last[level].width[level] = pos - last_pos[level]
+                last[level], last_pos[level] = node, pos
+            self.size = pos
+        for level in range(self.max_levels):        # ссылки на конец: конец стоит на позиции size + 1
+            last[level].width[level] = self.size + 1 - last_pos[level]
+
+    def _random_level(self):
+        return min(self.max_levels, 1 - int(math.log(1.0 - random.random(), 2.0)))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        node = self.head
+        i += 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        chain = [None] * self.max_levels            # последний узел перед value на каждом уровне
+        steps_at_level = [0] * self.max_levels
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        d = self._random_level()
+        new_node = _SkiplistNode(value, [None] * d, [None] * d)
+        steps = 0
+        for level in range(d):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(d, self.max_levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None] * self.max_levels
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        if value != chain[0].next[0].value:
+            raise KeyError("Значение не найдено в списке")
+
+        d = len(chain[0].next[0].next)
+        for level in range(d):
+            prev = chain[level]
+            prev.width[level] += prev.next[level].width[level] - 1
+            prev.next[level] = prev.next[level].next[level]
+        for level in range(d, self.max_levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+
+class RollingMedianSkiplist:
+    """Скользящая медиана (тот же интерфейс, что RollingMedian): add за O(log n), calculate - без округления.
+
+    Скалярная: одно значение на add. Среди методов усреднения эпох её нет - на [64 x 2000] это
+    128k списков на Python; для эпох - RollingMedianSortedArray.
+    """
+    def __init__(self, data, n_max, save_all=False):
+        self.n = n_max
+        self.trim_last = not save_all
+        data = list(data[-n_max:] if self.trim_last and n_max > 0 else data)
+        self.window = deque(data)
+        self.sorted_window = IndexableSkiplist(expected_size=max(n_max, len(data)), values=sorted(data))   # сортировка один раз
+
+    def add(self, value):
+        self.window.append(value)
+        self.sorted_window.insert(value)
+        if self.trim_last and len(self.window) > self.n:
+            self.sorted_window.remove(self.window.popleft())
+
+    def calculate(self):
+        m = len(self.sorted_window)
+        if m == 0:
+            return None
+        if m % 2 == 1:
+            return self.sorted_window[m // 2]
+        return (self.sorted_window[m // 2 - 1] + self.sorted_window[m // 2]) / 2
+
+
+class RunningMean:
+    """Среднее по всем добавленным значениям (сумма + счётчик), из которого можно убрать значение"""
+    def __init__(self, data=None):
+        self.count = 0
+        self.sum = 0.0
+        if data is not None and len(data) > 0:
+            self.sum = np.sum(np.asarray(data, dtype=float), axis=0)
+            self.count = len(data)
+
+    def add(self, value):
+        self.sum = self.sum + value
+        self.count += 1
+
+    def remove(self, value):
+        self.sum = self.sum - value
+        self.count -= 1
+
+    def calculate(self):
+        if self.count == 0:
+            return None
+        return self.sum * (1.0 / self.count)
+
+
+# --- векторизованные версии: одно окно сразу для всех каналов и отсчётов [n_channels x n_samples] ---
+
+class _EpochWindow:
+    """Окно последних эпох [window x n_channels x n_samples] в одном массиве.
+
+    При save_all=False это кольцевой буфер на n_max эпох (новая эпоха затирает самую старую),
+    при save_all=True буфер растёт геометрически и хранит все эпохи.
+    """
+    def __init__(self, data, n_max, save_all=False, dtype=np.float32):
+        data = np.asarray(data)
+        self.n = n_max
+        self.trim_last = not save_all
+        if self.trim_last:
+            data = data[-n_max:] if n_max > 0 else data[:0]     # в окно попадают самые свежие эпохи
+        self._dtype = dtype
+        self._capacity = n_max if self.trim_last else max(len(data), n_max, 1)
+        self._buffer = None         # если эпох нет, размер эпохи узнаем при первом добавлении
+        if data.ndim > 1:
+            self._allocate(data.shape[1:])
+            self._buffer[:len(data)] = data
+        self.count = len(data)
+        self._pos = len(data) % self._capacity if self._capacity else 0    # куда писать следующую эпоху
+
+    def _allocate(self, shape):
+        self._buffer = np.empty((self._capacity,) + tuple(shape), dtype=self._dtype)
+
+    @property
+    def window(self):
+        if self._buffer is None:
+            return np.empty((0,), dtype=self._dtype)
+        return self._buffer[:self.count]    # порядок эпох не важен ни для суммы, ни для медианы
+
+    def push(self, value):
+        """добавить эпоху; возвращает вытесненную эпоху (копию) или None"""
+        old = None
+        if self._buffer is None:
+            self._allocate(np.shape(value))
+        if self.trim_last:
+            if self.n == 0:
+                return None
+            if self.count == self.n:
+                old = self._buffer[self._pos].copy()
+            else:
+                self.count += 1
+            self._buffer[self._pos] = value
+            self._pos = (self._pos + 1) % self.n
+        else:
+            if self.count == self._buffer.shape[0]:
+                buffer = np.empty((2 * self.count,) + self._buffer.shape[1:], dtype=self._buffer.dtype)
+                buffer[:self.count] = self._buffer
+                self._buffer = buffer
+            self._buffer[self.count] = value
+            self.count += 1
+        return old
+
+
+class RollingMeanArray:
+    """Скользящее среднее по эпохам: бегущая сумма и счётчик для всех [n_channels x n_samples] сразу"""
+    def __init__(self, data, n_max, save_all=False):
+        # data: [n_epochs x n_channels x n_samples]
+        data = np.asarray(data, dtype=float)
+        self.trim_last = not save_all
+        if self.trim_last:                          # окно нужно только чтобы вычитать выпадающие эпохи
+            self._window = _EpochWindow(data, n_max, save_all=False, dtype=float)
+            data = self._window.window
+        self.count = len(data)
+        self.sum = data.sum(axis=0)
+
+    def add(self, value):
+        # value: [n_channels x n_samples]
+        if self.trim_last:
+            old = self._window.push(value)
+            if old is not None:
+                self.sum -= old
+            self.count = self._window.count
+            if self.count == 0:
+                return
+        else:
+            self.count += 1
+        self.sum = self.sum + value if np.ndim(self.sum) == 0 else np.add(self.sum, value, out=self.sum)
+
+    def calculate(self):
+        if self.count == 0:
+            return None
+        return self.sum * (1.0 / self.count)
+
+
+class RollingMedianArray:
+    """Скользящая медиана по эпохам для всех [n_channels x n_samples] сразу"""
+    def __init__(self, data, n_max, save_all=False):
+        self._window = _EpochWindow(data, n_max, save_all)
+
+    def add(self, value):
+        self._window.push(value)
+
+    def calculate(self):
+        if self._window.count == 0:
+            return None
+        return np.round(np.median(self._window.window, axis=0), 2)
+
+
+class RollingMedianSortedArray:
+    """Скользящая медиана по эпохам для всех [n_channels x n_samples] сразу по отсортированному окну.
+
+    Окно хранится отсортированным по оси эпох: новая эпоха вставляется, вытесненная удаляется
+    (сдвиг части окна, без сортировки), поэтому calculate - это выбор средних строк окна,
+    без np.median по всему окну на каждом кадре. Начальное окно сортируется один раз.
+    Вставка и удаление - O(window) на столбец, но векторизованно по всем столбцам (не O(log n),
+    как у RollingMedianSkiplist, зато без цикла на Python по каналам и отсчётам).
+    Результат не округляется. Данные не должны содержать NaN.
+    """
+    BLOCK = 8192    # столбцов за один проход (ограничивает размер временных массивов)
+
+    def __init__(self, data, n_max, save_all=False):
+        data = np.asarray(data)
+        self.trim_last = not save_all
+        self._window = _EpochWindow(data, n_max, save_all) if self.trim_last else None  # порядок прихода - только чтобы знать, что удалять
+        if self.trim_last:
+            data = data[-n_max:] if n_max > 0 else data[:0]
+        self._shape = data.shape[1:] if data.ndim > 1 else None
+        self.count = len(data)
+        self._sorted = None
+        if self._shape is not None:
+            capacity = n_max if self.trim_last else max(len(data), n_max, 1)
+            self._sorted = np.empty((max(capacity, 1), int(np.prod(self._shape))), dtype=np.float32)
+            self._sorted[:self.count] = np.sort(data.reshape(self.count, self._sorted.shape[1]), axis=0)
+
+    def add(self, value):
+        value = np.asarray(value, dtype=np.float32)
+        if self._sorted is None:
+            self._shape = value.shape
+            self._sorted = np.empty((max(1, self._window.n if self.trim_last else 1), value.size), dtype=np.float32)
+        old = self._window.push(value) if self.trim_last else None
+        if self.trim_last and self._window.n == 0:
+            return
+        if old is not None:
+            self._remove(old.reshape(-1))
+        elif self.count == self._sorted.shape[0]:   # save_all: буфер растёт геометрически
+            buffer = np.empty((2 * self.count, self._sorted.shape[1]), dtype=np.float32)
+            buffer[:self.count] = self._sorted[:self.count]
+            self._sorted = buffer
+        self._insert(value.reshape(-1))
+
+    def _insert(self, v):
+        m = self.count
+        rows = np.arange(m + 1)[:, np.newaxis]
+        for c in range(0, v.size, self.BLOCK):
+            block, vb = self._sorted[:m + 1, c:c + self.BLOCK], v[c:c + self.BLOCK]
+            pos = (block[:m] < vb).sum(axis=0)              # куда встаёт новое значение в каждом столбце
+            shifted = np.empty_like(block)
+            shifted[0], shifted[1:] = vb, block[:m]         # строки после pos сдвигаются вниз на одну
+            block[...] = np.where(rows < pos, block, np.where(rows == pos, vb, shifted))
+        self.count += 1
+
+    def _remove(self, v):
+        m = self.count
+        rows = np.arange(m - 1)[:, np.newaxis]
+        for c in range(0, v.size, self.BLOCK):
+            block, vb = self._sorted[:m, c:c + self.BLOCK], v[c:c + self.BLOCK]
+            pos = (block < vb).sum(axis=0)                  # первое вхождение удаляемого значения
+            block[:m - 1] = np.where(rows < pos, block[:m - 1], block[1:])
+        self.count -= 1
+
+    def calculate(self):
+        m = self.count
+        if m == 0:
+            return None
+        if m % 2 == 1:
+            median = self._sorted[m // 2].astype(float)
+        else:
+            median = (self._sorted[m // 2 - 1].astype(float) + self._sorted[m // 2]) / 2
+        return median.reshape(self._shape)
+
+
+class RollingTrimMeanArray:
+    """Скользящее усечённое среднее по эпохам для всех [n_channels x n_samples] сразу"""
+    def __init__(self, data, n_max, save_all=False, proportiontocut=0.1):
+        self._window = _EpochWindow(data, n_max, save_all)
+        self.proportiontocut = proportiontocut
+
+    def add(self, value):
+        self._window.push(value)
+
+    def calculate(self):
+        m = self._window.count
+        if m == 0:
+            return None
+
+        k = int(self.proportiontocut * m)   # пересчёт сколько данных обрезать
+        if m < 2 * k + 1:
+            return None  # мало данных для усечения
+        window = self._window.window
+        if k > 0:
+            # после partition в [k, m-k) лежат ровно значения между k-й и (m-k-1)-й порядковыми статистиками
+            window = np.partition(window, (k, m - k - 1), axis=0)[k:m - k]
+        return np.round(np.mean(window, axis=0), 2)
+
+
+AVERAGE_FUNCTIONS = {                   # метод усреднения -> класс (data, n_max, save_all) для всех каналов сразу
+    "mean": RollingMeanArray,
+    "median": RollingMedianArray,
+    "median_sorted": RollingMedianSortedArray,
+    "trimmean": RollingTrimMeanArray,
+}
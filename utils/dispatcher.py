@@ -1,15 +1,139 @@
-class CallDispatcher:       # заготовка для обработки входящего потока
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Subscriber:
+    """Подписчик диспетчера: функция, статистика вызовов и (для queued) своя очередь и поток"""
+    def __init__(self, name, callback, queued=False, queue_size=256, batch_window=None, max_batch=64):
+        self.name = name
+        self.callback = callback
+        self.queued = queued
+        self.batch_window = batch_window    # с: копить вызовы и передавать пачкой callback(list of args)
+        self.max_batch = max_batch
+
+        self.n_calls = 0
+        self.n_dropped = 0
+        self.n_errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+        if queued:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._sentinel = object()       # маркер завершения работы потока
+            self._thread = threading.Thread(target=self._loop, name=f"dispatcher-{name}", daemon=True)
+            self._thread.start()
+
+    def __call__(self, args, kwargs):
+        if not self.queued:
+            self._run(self.callback, *args, **kwargs)
+            return
+        # буфер драйвера переиспользуется - массивы копируются до постановки в очередь
+        args = tuple(np.array(a) if isinstance(a, np.ndarray) else a for a in args)
+        try:
+            self._queue.put_nowait((args, kwargs))
+        except queue.Full:
+            self.n_dropped += 1
+
+    def _run(self, func, *args, **kwargs):
+        # ошибка подписчика не должна останавливать ни его поток, ни раздачу остальным подписчикам
+        t0 = time.perf_counter()
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            self.n_errors += 1
+            print(f"---> Ошибка подписчика {self.name}: {e!r}")
+        finally:
+            dt = (time.perf_counter() - t0) * 1000
+            self.n_calls += 1
+            self.total_ms += dt
+            self.max_ms = max(self.max_ms, dt)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is self._sentinel:
+                return
+            if self.batch_window is None:
+                args, kwargs = item
+                self._run(self.callback, *args, **kwargs)
+                continue
+
+            batch = [item[0]]
+            deadline = time.monotonic() + self.batch_window
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is self._sentinel:
+                    stop = True
+                    break
+                batch.append(item[0])
+            self._run(self.callback, batch)
+            if stop:
+                return
+
+    def close(self):
+        if self.queued:
+            self._queue.put(self._sentinel)
+            self._thread.join()
+
+    def stats(self):
+        return {"calls": self.n_calls,
+                "mean_ms": self.total_ms / self.n_calls if self.n_calls else 0.0,
+                "max_ms": self.max_ms,
+                "dropped": self.n_dropped,
+                "errors": self.n_errors,
+                "pending": self._queue.qsize() if self.queued else 0}
+
+
+class CallDispatcher:       # обработчик входящего потока: раздаёт сообщения всем подписчикам
+    """Шина для входящего потока: каждый вызов передаётся всем подписчикам в порядке подписки.
+
+    Обычный подписчик вызывается сразу в потоке источника. queued-подписчик получает копию
+    аргументов через свою ограниченную очередь и работает в своём потоке (медленный потребитель
+    не задерживает остальных; при переполнении вызовы отбрасываются). Исключение подписчика
+    печатается и считается в stats, остальные подписчики вызов получают. С batch_window вызовы
+    копятся до batch_window секунд (не больше max_batch) и передаются одним списком аргументов.
+    set_callback - прежний интерфейс с одним обработчиком (подписчик "main").
+    """
     def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
         self.reset()
-        
+
     def reset(self):
-        self._call = self._none
-        
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, {}
+        for subscriber in subscribers.values():
+            subscriber.close()
+
     def set_callback(self, callback):
-        self._call = callback
-        
-    def _none(self, *kargs, **kwargs):
-        pass
-    
+        self.subscribe("main", callback)
+
+    def subscribe(self, name, callback, queued=False, queue_size=256, batch_window=None, max_batch=64):
+        """подписать callback под именем name (подписчик с тем же именем заменяется)"""
+        self.unsubscribe(name)
+        subscriber = _Subscriber(name, callback, queued, queue_size, batch_window, max_batch)
+        with self._lock:
+            self._subscribers = {**self._subscribers, name: subscriber}     # новый dict - вызовы идут без блокировки
+
+    def unsubscribe(self, name):
+        with self._lock:
+            subscribers = dict(self._subscribers)
+            subscriber = subscribers.pop(name, None)
+            self._subscribers = subscribers
+        if subscriber is not None:
+            subscriber.close()
+
+    def stats(self):
+        """имя подписчика -> {calls, mean_ms, max_ms, dropped, errors, pending}"""
+        return {name: subscriber.stats() for name, subscriber in self._subscribers.items()}
+
     def __call__(self, *kargs, **kwargs):
-        self._call(*kargs, **kwargs)
\ No newline at end of file
+        for subscriber in self._subscribers.values():
+            subscriber(kargs, kwargs)
@@ -0,0 +1,95 @@
+import numpy as np
+
+
+class EpochStore:
+    """Хранилище эпох в одном непрерывном массиве [capacity x n_channels x n_samples].
+
+    Память выделяется с запасом и растёт геометрически, поэтому добавление эпохи - O(1)
+    (амортизированно), а доступ к эпохам и каналам - это view без копирования.
+    Рядом с каждой эпохой хранятся таймстемп и смещения бейзлайна по каналам.
+    """
+    def __init__(self, n_channels, n_samples, capacity=64, dtype=np.float32):
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self._dtype = dtype
+        self._n = 0
+        self._buffer = np.empty((capacity, n_channels, n_samples), dtype=dtype)
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._offsets = np.zeros((capacity, n_channels), dtype=dtype)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    @property
+    def nbytes(self):
+        """выделенная память (с запасом под следующие эпохи), а не только занятая часть"""
+        return self._buffer.nbytes + self._timestamps.nbytes + self._offsets.nbytes
+
+    @property
+    def data(self):
+        """view на все хранимые эпохи [n_epochs x n_channels x n_samples]"""
+        return self._buffer[:self._n]
+
+    @property
+    def timestamps(self):
+        """таймстемпы резонанса для хранимых эпох (в нс)"""
+        return self._timestamps[:self._n]
+
+    @property
+    def offsets(self):
+        """смещения бейзлайна для хранимых эпох [n_epochs x n_channels] (view - можно перезаписывать)"""
+        return self._offsets[:self._n]
+
+    def channels(self, idx):
+        """выбранные каналы всех эпох: [n_epochs x n_selected x n_samples] (для slice - view без копирования)"""
+        return self._buffer[:self._n, idx]
+
+    def append(self, epoch, timestamp=0, offsets=0):
+        # epoch: [n_channels x n_samples], offsets: [n_channels]
+        if self._n == self.capacity:
+            self._grow()
+        self._buffer[self._n] = epoch
+        self._timestamps[self._n] = timestamp
+        self._offsets[self._n] = offsets
+        self._n += 1
+
+    def extend(self, epochs, timestamps=None, offsets=None):
+        # epochs: [n_epochs x n_channels x n_samples]
+        n_new = len(epochs)
+        while self._n + n_new > self.capacity:
+            self._grow()
+        self._buffer[self._n:self._n + n_new] = epochs
+        self._timestamps[self._n:self._n + n_new] = 0 if timestamps is None else timestamps
+        self._offsets[self._n:self._n + n_new] = 0 if offsets is None else offsets
+        self._n += n_new
+
+    def remove(self, idx):
+        """удалить эпоху с номером idx (нумерация с нуля), остальные сдвигаются"""
+        if idx < 0:
+            idx += self._n
+        if not 0 <= idx < self._n:
+            raise IndexError(f"epoch index {idx} out of range [0, {self._n})")
+        self._buffer[idx:self._n - 1] = self._buffer[idx + 1:self._n]
+        self._timestamps[idx:self._n - 1] = self._timestamps[idx + 1:self._n]
+        self._offsets[idx:self._n - 1] = self._offsets[idx + 1:self._n]
+        self._n -= 1
+
+    def clear(self):
+        self._n = 0     # память не освобождается - переиспользуется следующей сессией
+
+    def _grow(self):
+        capacity = max(1, 2 * self.capacity)
+        buffer = np.empty((capacity, self.n_channels, self.n_samples), dtype=self._dtype)
+        buffer[:self._n] = self._buffer[:self._n]
+        timestamps = np.empty(capacity, dtype=np.int64)
+        timestamps[:self._n] = self._timestamps[:self._n]
+        offsets = np.zeros((capacity, self.n_channels), dtype=self._dtype)
+        offsets[:self._n] = self._offsets[:self._n]
+        self._buffer, self._timestamps, self._offsets = buffer, timestamps, offsets
@@ -0,0 +1,108 @@
+import csv
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+BIN_EDGES_MS = np.geomspace(0.01, 10000, 61)     # логарифмические корзины гистограмм: 10 мкс ... 10 с
+
+
+class LatencyMonitor:
+    """Измерение задержек прохождения эпохи по стадиям: от callback драйвера до отрисовки.
+
+    Каждое измерение привязано к ключу - таймстемпу резонанса эпохи. Для каждой стадии
+    копится гистограмма длительностей и последние max_records измерений (для перцентилей и экспорта).
+    Стадия "total" - время от прихода эпохи в драйвер (mark_arrival) до конца отрисовки (finish).
+    """
+    def __init__(self, max_records=10000, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_records)                          # (key, stage, start [с], длительность [мс])
+        self._durations = defaultdict(lambda: deque(maxlen=max_records))   # stage -> последние длительности [мс]
+        self._hist = defaultdict(lambda: np.zeros(len(BIN_EDGES_MS) + 1, dtype=np.int64))  # + корзины за краями
+        self._arrivals = {}                                                # key -> perf_counter прихода эпохи
+
+    @contextmanager
+    def span(self, stage, key=None):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - t0) * 1000, key=key, start=t0)
+
+    def record(self, stage, duration_ms, key=None, start=None):
+        start = time.perf_counter() if start is None else start
+        with self._lock:
+            self._records.append((key, stage, start, duration_ms))
+            self._durations[stage].append(duration_ms)
+            self._hist[stage][np.searchsorted(BIN_EDGES_MS, duration_ms)] += 1
+
+    def mark_arrival(self, key):
+        if self.enabled:
+            with self._lock:
+                self._arrivals[key] = time.perf_counter()
+
+    def finish(self, key):
+        """эпоха key отрисована: записать полную задержку от прихода в драйвер"""
+        if not self.enabled:
+            return
+        with self._lock:
+            t0 = self._arrivals.pop(key, None)
+            if len(self._arrivals) > 1000:      # эпохи, которые так и не дошли до экрана
+                self._arrivals.clear()
+        if t0 is not None:
+            self.record("total", (time.perf_counter() - t0) * 1000, key=key, start=t0)
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+            self._durations.clear()
+            self._hist.clear()
+            self._arrivals.clear()
+
+    def summary(self):
+        """stage -> {count, mean, p50, p95, max} в мс (по последним измерениям)"""
+        with self._lock:
+            durations = {stage: np.array(values) for stage, values in self._durations.items() if values}
+        return {stage: {"count": len(d),
+                        "mean": float(d.mean()),
+                        "p50": float(np.percentile(d, 50)),
+                        "p95": float(np.percentile(d, 95)),
+                        "max": float(d.max())}
+                for stage, d in durations.items()}
+
+    def histograms(self):
+        """stage -> счётчики по корзинам BIN_EDGES_MS (первая и последняя - за пределами краёв)"""
+        with self._lock:
+            return {stage: counts.copy() for stage, counts in self._hist.items()}
+
+    def overlay_text(self, stages=None):
+        summary = self.summary()
+        stages = stages or sorted(summary)
+        parts = [f"{stage}: {summary[stage]['p50']:.1f}/{summary[stage]['p95']:.1f}"
+                 for stage in stages if stage in summary]
+        return "мс (p50/p95)  " + "  ".join(parts) if parts else ""
+
+    def export_csv(self, path):
+        with self._lock:
+            records = list(self._records)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timestamp", "stage", "start_s", "duration_ms"])
+            writer.writerows(records)
+
+    def export_json(self, path):
+        data = {"bin_edges_ms": BIN_EDGES_MS.tolist(),
+                "summary": self.summary(),
+                "histograms": {stage: counts.tolist() for stage, counts in self.histograms().items()}}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+monitor = LatencyMonitor()      # общий монитор для драйвера, обработки и отрисовки
@@ -0,0 +1,280 @@
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+from utils.epoch_store import EpochStore
+
+
+def car_matrix(is_selected):
+    """матрица CAR-фильтра: из каждого канала вычитается среднее по выбранным каналам"""
+    is_selected = np.asarray(is_selected, dtype=float)
+    n_channels, n_sel = len(is_selected), is_selected.sum()
+    if n_sel == 0:
+        raise ValueError("Не отмечены каналы для построения CAR фильтра.")
+    return np.eye(n_channels) - (1 / n_sel) * np.outer(np.ones(n_channels), is_selected)
+
+
+def rereference_matrix(n_channels, idx):
+    """матрица ре-референтации: из каждого канала вычитается канал idx"""
+    e_r = np.zeros((n_channels, 1))
+    e_r[idx, 0] = 1.0
+    return np.eye(n_channels) - np.ones((n_channels, 1)) @ e_r.T
+
+
+def mep_peak_to_peak(mep, start, end):
+    """размах MEP (max - min) в окне [start, end) по последней оси и индекс максимума в окне
+
+    mep: одна кривая [n_samples] или пачка [n_epochs x n_samples] -> (амплитуды, индексы)
+    """
+    x = np.asarray(mep)[..., start:end]
+    return x.max(axis=-1) - x.min(axis=-1), x.argmax(axis=-1)
+
+
+@lru_cache(maxsize=32)
+def _butter_sos(order, cutoff, Fs, btype):
+    return signal.butter(order, cutoff / Fs * 2, btype=btype, output='sos')
+
+
+def butter_sos(order, cutoff, Fs, btype='lowpass'):
+    """коэффициенты фильтра Баттерворта в виде SOS (расчёт кэшируется по (order, cutoff, Fs))"""
+    return _butter_sos(order, cutoff, Fs, btype).copy()    # копия: sosfilt требует записываемый массив, кэш не портится
+
+
+class LowpassFilter:
+    """Фильтр низких частот по последней оси (времени) для эпохи или пачки эпох [n_epochs x n_channels x n_samples].
+
+    Пачка фильтруется одним вызовом sosfilt/sosfiltfilt (zero_phase=True - без фазового сдвига).
+    stream() - потоковый режим: фильтрует очередной блок и возвращает состояние фильтра для следующего блока.
+    """
+    def __init__(self, cutoff, Fs, order=2, zero_phase=False):
+        self.cutoff, self.Fs, self.order = cutoff, Fs, order
+        self.zero_phase = zero_phase
+        self.sos = butter_sos(order, cutoff, Fs)
+
+    @property
+    def key(self):
+        """описание параметров для ключей кэша"""
+        return ("lowpass", self.cutoff, self.Fs, self.order, self.zero_phase)
+
+    def __call__(self, x):
+        if self.zero_phase:
+            return signal.sosfiltfilt(self.sos, x, axis=-1)
+        return signal.sosfilt(self.sos, x, axis=-1)
+
+    def initial_state(self, x):
+        """установившееся состояние фильтра для первого отсчёта x (без скачка на краю): [n_sections x ... x 2]"""
+        zi = signal.sosfilt_zi(self.sos)                                # [n_sections x 2]
+        zi = zi.reshape((zi.shape[0],) + (1,) * (x.ndim - 1) + (2,))
+        return zi * x[np.newaxis, ..., :1]
+
+    def stream(self, x, zi=None):
+        """причинная фильтрация блока x с продолжением состояния zi; возвращает (y, zf)"""
+        if zi is None:
+            zi = self.initial_state(x)
+        return signal.sosfilt(self.sos, x, axis=-1, zi=zi)
+
+
+class Baseline:
+    """Вычитание бейзлайна: смещение канала - mean/median по отсчётам [ind_start, ind_end) последней оси.
+
+    Без окна (ind_start=None) бейзлайн выключен: смещения нулевые, данные не меняются.
+    """
+    def __init__(self, ind_start=None, ind_end=None, method='mean'):
+        self.ind_start, self.ind_end = ind_start, ind_end
+        self.method = method
+        self.enabled = ind_start is not None
+
+    @property
+    def key(self):
+        return ("baseline", self.ind_start, self.ind_end, self.method) if self.enabled else None
+
+    def offsets(self, x):
+        """смещения для эпохи или пачки эпох: [..., n_channels, n_samples] -> [..., n_channels]"""
+        if not self.enabled:
+            return np.zeros(x.shape[:-1], dtype=x.dtype)
+        func = np.mean if self.method == 'mean' else np.median
+        return func(x[..., self.ind_start:self.ind_end], axis=-1)
+
+    def __call__(self, x, offsets=None):
+        if not self.enabled:
+            return x
+        if offsets is None:
+            offsets = self.offsets(x)
+        return x - offsets[..., np.newaxis]
+
+
+class SpatialFilter:
+    """Линейный пространственный фильтр из нескольких стадий (CAR, ре-референтация, ...).
+
+    Все включённые стадии заранее свёрнуты в одну матрицу [n_channels x n_channels], которая
+    пересобирается только при изменении какой-либо стадии. Применение к одной эпохе или к пачке
+    эпох - один matmul.
+    """
+    def __init__(self, stages=("CAR", "rereference")):
+        self._stages = {name: None for name in stages}  # порядок применения = порядок в stages
+        self._matrix = None                             # None - все стадии выключены (тождественное преобразование)
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @property
+    def key(self):
+        if self._matrix is None:
+            return None
+        return ("spatial", hashlib.sha1(np.ascontiguousarray(self._matrix).tobytes()).hexdigest())
+
+    def set_stage(self, name, matrix=None):
+        """задать матрицу стадии (None - стадия выключена) и пересобрать общую матрицу"""
+        if name not in self._stages:
+            raise KeyError(f"Неизвестная стадия пространственного фильтра: {name}")
+        self._stages[name] = None if matrix is None else np.asarray(matrix, dtype=float)
+        self._rebuild()
+
+    def apply(self, x):
+        # x: [n_channels x n_samples] или [n_epochs x n_channels x n_samples]
+        if self._matrix is None:
+            return x
+        return np.matmul(self._matrix, x)
+
+    def _rebuild(self):
+        matrix = None
+        for W in self._stages.values():
+            if W is not None:
+                matrix = W if matrix is None else W @ matrix    # следующая стадия применяется после предыдущих
+        self._matrix = matrix
+
+
+class TransformCache:
+    """Цепочка преобразований эпох с кэшем результата каждой стадии для всех эпох.
+
+    stages - список пар (имя, функция), функция принимает пачку [n_epochs x n_channels x n_samples]
+    (и одну эпоху [n_channels x n_samples]) и работает по последней оси как по времени.
+    При изменении стадии пересчёт идёт только с этой стадии, одним вызовом на все эпохи,
+    начиная с последней сохранённой предыдущей стадии. Кэш стадии либо полный (есть для всех эпох),
+    либо отсутствует. Если кэш превышает max_bytes, вытесняются давно не использованные
+    промежуточные стадии; результат последней стадии хранится всегда.
+    Тождественная стадия (функция вернула свой вход, например выключенный фильтр) не копирует
+    данные: её кэш - тот же EpochStore, что у предыдущей стадии.
+    """
+    def __init__(self, source, stages, n_channels, n_samples, max_bytes=None):
+        self._source = source                   # функция -> входные данные всех эпох [n_epochs x n_channels x n_samples]
+        self._names = [name for name, _ in stages]
+        self._funcs = dict(stages)
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.max_bytes = max_bytes
+
+        self._n = 0                                         # количество эпох
+        self._cache = {name: None for name in self._names}  # имя стадии -> EpochStore с результатами или None
+        self._last_used = {name: 0 for name in self._names}
+        self._clock = 0
+
+    def __len__(self):
+        return self._n
+
+    def set_stage(self, name, func):
+        self._funcs[name] = func
+        self.invalidate(name)
+
+    def invalidate(self, name):
+        """сбросить кэш стадии name и всех следующих за ней"""
+        for stage in self._names[self._names.index(name):]:
+            self._cache[stage] = None
+
+    def key(self):
+        """параметры всех стадий (атрибут key функции или её объекта; None - тождественное преобразование)"""
+        return tuple(getattr(getattr(self._funcs[name], "__self__", self._funcs[name]), "key", None)
+                     for name in self._names)
+
+    def transform(self, x):
+        """применить всю цепочку без кэширования: x - одна эпоха или пачка эпох"""
+        for name in self._names:
+            x = self._funcs[name](x)
+        return x
+
+    def append(self, epoch):
+        """добавить новую эпоху [n_channels x n_samples]; возвращает её результат после всех стадий"""
+        x = epoch[np.newaxis]
+        for name, store in zip(self._names, self._stage_stores()):
+            x = self._funcs[name](x)
+            if store is not None:           # общий для тождественных стадий - один раз
+                store.append(x[0])
+        self._n += 1
+        self._evict()                       # кэш растёт с каждой эпохой
+        return x[0]
+
+    def remove(self, idx):
+        for store in self._unique_stores():
+            store.remove(idx)
+        self._n -= 1
+
+    def clear(self):
+        for store in self._unique_stores():
+            store.clear()
+        self._n = 0
+
+    def _stage_stores(self):
+        """EpochStore каждой стадии, где повторное появление общего хранилища заменено на None"""
+        seen = set()
+        stores = []
+        for name in self._names:
+            store = self._cache[name]
+            stores.append(store if store is not None and id(store) not in seen else None)
+            if store is not None:
+                seen.add(id(store))
+        return stores
+
+    def _unique_stores(self):
+        return [store for store in self._stage_stores() if store is not None]
+
+    def get(self, name=None):
+        """результаты стадии name (по умолчанию последней) для всех эпох: [n_epochs x n_channels x n_samples]"""
+        name = self._names[-1] if name is None else name
+        target = self._names.index(name)
+
+        # ближайшая сохранённая стадия, начиная с которой нужно досчитать
+        start = target
+        while start >= 0 and self._cache[self._names[start]] is None:
+            start -= 1
+        if start == target:
+            self._touch(name)
+            return self._cache[name].data
+
+        prev = self._names[start] if start >= 0 else None
+        x = self._cache[prev].data if prev is not None else self._source()
+        if prev is not None:
+            self._touch(prev)
+        for stage in self._names[start + 1:target + 1]:
+            y = self._funcs[stage](x)           # один векторизованный вызов на все эпохи
+            if y is x and prev is not None:     # тождественная стадия: общий кэш с предыдущей, без копии
+                self._cache[stage] = self._cache[prev]
+                self._touch(stage)
+            else:
+                self._store(stage, y)
+            x, prev = y, stage
+        self._evict()
+        return self._cache[name].data
+
+    def nbytes(self):
+        return sum(store.nbytes for store in self._unique_stores())     # выделенные буферы стадий (общие - один раз)
+
+    def _store(self, name, x):
+        store = EpochStore(self.n_channels, self.n_samples, capacity=max(len(x), 1))
+        store.extend(x)
+        self._cache[name] = store
+        self._touch(name)
+
+    def _touch(self, name):
+        self._clock += 1
+        self._last_used[name] = self._clock
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        intermediate = [name for name in self._names[:-1] if self._cache[name] is not None]
+        intermediate.sort(key=lambda name: self._last_used[name])
+        while intermediate and self.nbytes() > self.max_bytes:
+            self._cache[intermediate.pop(0)] = None
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from utils.averaging_math import RunningMean
+from utils.epoch_store import EpochStore
+from utils.latency import monitor as latency
+from utils.processing import Baseline, SpatialFilter, TransformCache
+from utils.session_io import write_session
+
+
+class ProcessingWorker(QThread):
+    """Поток обработки эпох: хранилище, цепочка преобразований, усреднение TEPs и MEP.
+
+    Эпохи (submit_epoch, из потока драйвера) и команды (submit, из GUI) выполняются по очереди
+    в этом потоке, поэтому состояние меняется только здесь. Готовые к отрисовке данные уходят
+    в GUI сигналом frame_ready (соединение между потоками - queued). Промежуточные кадры
+    пропускаются: кадр публикуется, когда очередь пуста, но не реже чем раз в publish_interval.
+    Число ожидающих эпох ограничено queue_size: при policy='drop' лишние эпохи отбрасываются,
+    при policy='block' поток драйвера ждёт.
+    """
+    frame_ready = pyqtSignal(object)    # dict: TEPs, emg, mep_average, n_epoch, timestamp
+    epoch_ready = pyqtSignal(object)    # преобразованные TEPs одной эпохи (по запросу publish_epoch)
+
+    def __init__(self, n_channels, n_samples, average_functions, queue_size=256, policy="drop",
+                 publish_interval=1/30, max_cache_bytes=None, mep_window=None, parent=None):
+        super().__init__(parent)
+        self.n_samples = n_samples
+        self.policy = policy
+        self.publish_interval = publish_interval
+        self.mep_window = mep_window        # окно размаха MEP (отсчёты эпохи) для meta/mep_amplitude при сохранении
+
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(queue_size)   # свободные места для эпох в очереди (команды не ограничены)
+        self._sentinel = object()                       # маркер завершения работы потока
+        self._last_publish = 0.0
+        self._last_timestamp = None
+        self.n_dropped = 0
+
+        # --- состояние (меняется только в потоке обработки) ---
+        self.store = EpochStore(n_channels=n_channels + 2, n_samples=n_samples)   # все single-trial эпохи (64 EEG + 2 EMG)
+        self.baseline = Baseline()
+        self.spatial_filter = SpatialFilter(stages=("CAR", "rereference"))
+        identity = lambda x: x
+        store = self.store      # source ссылается на хранилище, а не на self: без цикла ссылок worker <-> pipeline
+        self.pipeline = TransformCache(
+            source=lambda: store.channels(slice(None, -2)) * 1E6,              # только TEPs всех эпох в мкВ
+            stages=[("lowpass", identity),
+                    ("baseline", identity),
+                    ("spatial", self.spatial_filter.apply)],
+            n_channels=n_channels, n_samples=n_samples, max_bytes=max_cache_bytes)
+
+        self._average_functions = average_functions     # имя метода -> функция (data, n_max, save_all)
+        self._averaging = None                          # (method, n_max, aver_all) или None - режим одиночных проб
+        self.average_function = None
+        self.mep_average = RunningMean()
+
+    # --- вызываются из других потоков ---
+    def submit_epoch(self, msg, timestamp):
+        # msg: [n_samples x n_channels] - буфер драйвера переиспользуется, поэтому копия
+        if not self._slots.acquire(blocking=(self.policy == "block")):
+            self.n_dropped += 1
+            print(f"---> Обработка не успевает: эпоха отброшена (всего {self.n_dropped})")
+            return
+        self._queue.put((self._process_epoch, (np.array(msg).T, timestamp), True, True))
+
+    def submit(self, func, *args, publish=True):
+        """выполнить func(*args) в потоке обработки после уже поставленных эпох; затем публикуется кадр
+
+        publish=False - для запросов, не меняющих состояние (publish_epoch): кадр после них не нужен
+        и перекрыл бы в GUI их собственный результат.
+        """
+        self._queue.put((func, args, False, publish))
+
+    def stop(self):
+        self._queue.put(self._sentinel)
+        self.wait()
+
+    # --- поток обработки ---
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._sentinel:
+                break
+            func, args, is_epoch, publish = item
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"---> Ошибка обработки: {e}")
+            finally:
+                if is_epoch:
+                    self._slots.release()
+
+            if is_epoch:
+                due = time.perf_counter() - self._last_publish >= self.publish_interval
+                if self._queue.empty() or due:
+                    self._publish()
+            elif publish:
+                self._publish()
+
+    def _process_epoch(self, epoch, timestamp):
+        # epoch: [n_channels x n_samples], n_channels = EEG_channels + 2 EMG_channels
+        self.store.append(epoch, timestamp, self.baseline.offsets(epoch))   # эпоха + смещения бейзлайна всех 66 каналов
+        self.mep_average.add(self.epoch_to_MEP(-1))
+
+        TEPs = self.store[-1, :-2] * 1E6                # выделить только TEPs и преобразовать в мкВ
+        with latency.span("transform", timestamp):
+            TEPs2plot = self.pipeline.append(TEPs)      # нужные преобразования (с сохранением стадий) -> [n_channels x n_samples]
+        if self.average_function is not None:           # режим усреднения - обновить функции усреднения
+            with latency.span("averaging", timestamp):
+                self.average_function.add(TEPs2plot)
+        self._last_timestamp = timestamp
+
+    def _publish(self):
+        self._last_publish = time.perf_counter()
+        n_epoch = len(self.store)
+        frame = {"n_epoch": n_epoch, "timestamp": self._last_timestamp,
+                 "TEPs": None, "emg": None, "mep_average": None}
+        if n_epoch > 0:
+            if self.average_function is not None:
+                with latency.span("averaging", self._last_timestamp):
+                    frame["TEPs"] = self.average_function.calculate()       # усреднённые TEPs [n_channels x n_samples]
+            else:
+                frame["TEPs"] = np.array(self.pipeline.get()[-1])           # последняя эпоха после всех преобразований
+            frame["emg"] = self.epoch_to_MEP(-1)
+            frame["mep_average"] = self.mep_average.calculate()
+        self.frame_ready.emit(frame)
+
+    def epoch_to_MEP(self, idx):
+        """MEP эпохи idx: EMG-каналы за вычетом сохранённого бейзлайна (в мВ), разница каналов -> [n_samples]"""
+        emg = (self.store[idx, -2:] - self.store.offsets[idx, -2:, np.newaxis]) * 1E3
+        return emg[1] - emg[0]
+
+    def _create_MEP_average(self):
+        """пересчитать среднее MEP по всем хранимым эпохам (нужно только при смене бейзлайна)"""
+        emg = (self.store.channels(slice(-2, None)) - self.store.offsets[:, -2:, np.newaxis]) * 1E3   # [n_epochs x 2 x n_samples]
+        self.mep_average = RunningMean(emg[:, 1] - emg[:, 0])
+
+    def _create_average_functions(self):
+        """создать функции усреднения по всем хранимым (уже преобразованным) эпохам"""
+        if self._averaging is None:
+            self.average_function = None
+            return
+        method, n_max, aver_all = self._averaging
+        data = self.pipeline.get() if len(self.store) > 0 else np.empty((0, self.pipeline.n_channels, self.n_samples))
+        self.average_function = self._average_functions[method](data, n_max, aver_all)
+
+    # --- команды (выполняются в потоке обработки через submit) ---
+    def set_averaging(self, averaging):
+        """averaging: (method, n_max, aver_all) или None - без усреднения"""
+        self._averaging = averaging
+        self._create_average_functions()
+
+    def set_lowpass(self, lowpass_filter):
+        self.pipeline.set_stage("lowpass", lowpass_filter)
+        self._create_average_functions()
+
+    def set_baseline(self, baseline):
+        self.baseline = baseline
+        self.pipeline.set_stage("baseline", baseline)
+        self.store.offsets[:] = baseline.offsets(self.store.data)     # новые смещения всех эпох одним проходом
+        self._create_MEP_average()                                     # средний MEP зависит от бейзлайна
+        self._create_average_functions()
+
+    def set_spatial(self, name, matrix):
+        self.spatial_filter.set_stage(name, matrix)     # общая матрица пересобирается только здесь
+        self.pipeline.invalidate("spatial")             # пересчёт только пространственной стадии
+        self._create_average_functions()
+
+    def remove(self, idx):
+        self.mep_average.remove(self.epoch_to_MEP(idx))
+        self.store.remove(idx)
+        self.pipeline.remove(idx)
+        self._create_average_functions()                # пересчитать средние без удалённой эпохи
+
+    def clear(self):
+        self.store.clear()
+        self.pipeline.clear()
+        self.mep_average = RunningMean()
+        self._create_average_functions()
+
+    def publish_epoch(self, idx):
+        self.epoch_ready.emit(np.array(self.pipeline.get()[idx]))
+
+    def save(self, file_path, Fs):
+        write_session(file_path, self.store.data, self.store.timestamps, Fs,   # [n_epochs x n_channels x n_samples]
+                      mep_window=self.mep_window)
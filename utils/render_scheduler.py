@@ -0,0 +1,47 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+class RenderScheduler(QObject):
+    """Перерисовка панелей с ограничением частоты кадров.
+
+    Обработчик данных только помечает панель как "грязную" (mark_dirty), а перерисовка
+    выполняется по таймеру не чаще max_fps раз в секунду. Если за кадр пришло несколько эпох,
+    панель перерисуется один раз - с аргументами последней пометки.
+    Панели перерисовываются в порядке регистрации.
+    """
+    def __init__(self, max_fps=30, parent=None):
+        super().__init__(parent)
+        self._interval_ms = 1000 / max_fps
+        self._panels = {}           # имя -> функция перерисовки
+        self._dirty = {}            # имя -> kwargs для функции перерисовки
+        self._last_flush = 0.0      # время последней перерисовки (perf_counter, с)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def register(self, name, callback):
+        self._panels[name] = callback
+
+    def mark_dirty(self, name, **kwargs):
+        self._dirty[name] = kwargs
+        if not self._timer.isActive():
+            # первый кадр после паузы рисуется сразу, следующие - не раньше чем через интервал
+            elapsed_ms = (time.perf_counter() - self._last_flush) * 1000
+            self._timer.start(int(max(0, self._interval_ms - elapsed_ms)))
+
+    def cancel(self, name=None):
+        """снять пометку (например, панель уже перерисована синхронно)"""
+        if name is None:
+            self._dirty.clear()
+        else:
+            self._dirty.pop(name, None)
+
+    def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        self._last_flush = time.perf_counter()
+        for name, callback in self._panels.items():
+            if name in dirty:
+                callback(**dirty[name])
@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+from utils.session_io import SessionReader
+
+class StreamReplayer(threading.Thread):
+    """Воспроизведение сохранённой сессии (.h5) как входного потока драйвера.
+
+    Эпохи [n_samples x n_channels] передаются в callback(arr, timestamp) из отдельного потока,
+    как их передаёт Driver.inputDataStream (буфер переиспользуется, данные валидны до следующего вызова).
+    Время отправки эпохи k - абсолютный дедлайн t0 + offset_k / speed, поэтому ошибки sleep
+    не накапливаются: опоздание на одной эпохе не сдвигает следующие. Ожидание - только sleep
+    (без активного ожидания), чтобы не отнимать GIL у потоков приложения.
+    offset_k - по сохранённым timestamps (timestamp_unit_s секунд на единицу) или k * period_s.
+    burst=n - эпохи отправляются пачками по n подряд без пауз (в момент первой эпохи пачки).
+    speed=inf - без пауз вообще. loop=True - по кругу до stop() (timestamps сдвигаются, чтобы не повторяться).
+    n_samples - длина эпохи для исходных файлов без атрибутов (см. SessionReader).
+    """
+    def __init__(self, file_path, callback, speed=1.0, period_s=None, timestamp_unit_s=1E-9, burst=1,
+                 loop=False, chunk_epochs=64, monitor=None, n_samples=None):
+        super().__init__(name="replay", daemon=True)
+        self.reader = SessionReader(file_path, n_samples)
+        if len(self.reader) == 0:
+            raise ValueError(f"{self.reader.name}: в файле нет эпох - воспроизводить нечего")
+        self.callback = callback
+        self.speed = speed
+        self.burst = max(1, int(burst))
+        self.loop = loop
+        self.chunk_epochs = chunk_epochs
+        self.monitor = monitor
+
+        self._timestamps = self.reader.timestamps().astype(np.int64)
+        self._schedule(period_s, timestamp_unit_s)
+        self._stop_event = threading.Event()
+
+        self.n_sent = 0
+        self.n_late = 0             # эпохи (первые в пачке), отправленные позже дедлайна больше чем на 1 мс
+        self.max_lag_ms = 0.0
+        self.elapsed_s = 0.0
+
+    def _schedule(self, period_s, timestamp_unit_s):
+        """смещения эпох от начала прохода (с) и шаг между проходами при loop (с и в единицах timestamps)"""
+        steps = np.diff(self._timestamps)
+        if period_s is None and len(steps) > 0 and np.all(steps > 0):
+            self._step = int(np.median(steps))
+            self._offsets = (self._timestamps - self._timestamps[0]) * timestamp_unit_s
+        else:
+            if period_s is None:
+                period_s = 1.0
+                print("---> Replay: timestamps не возрастают, интервал между эпохами 1 с")
+            self._step = max(1, int(round(period_s / timestamp_unit_s)))
+            self._timestamps = self._timestamps[0] + np.arange(len(self._timestamps), dtype=np.int64) * self._step
+            self._offsets = np.arange(len(self._timestamps)) * period_s
+        self._pass_ts = int(self._timestamps[-1] - self._timestamps[0]) + self._step     # длина прохода в единицах timestamps
+        self._pass_s = self._offsets[-1] + self._step * timestamp_unit_s                 # длина прохода при speed=1
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        buffer = np.empty((self.reader.n_samples, self.reader.n_channels))   # как в драйвере: один буфер на все эпохи
+        t0 = time.perf_counter()
+        n_pass = 0
+        while not self._stop_event.is_set():
+            k = 0
+            for chunk in self.reader.iter_chunks(chunk_epochs=self.chunk_epochs):
+                for epoch in chunk:
+                    first = k - k % self.burst                  # первая эпоха пачки задаёт время всей пачки
+                    deadline = t0 + (n_pass * self._pass_s + self._offsets[first]) / self.speed
+                    if not self._wait_until(deadline):
+                        break
+                    self._send(buffer, epoch, int(self._timestamps[k]) + n_pass * self._pass_ts,
+                               deadline if k == first else None)
+                    k += 1
+                if self._stop_event.is_set():
+                    break
+            n_pass += 1
+            if not self.loop:
+                break
+        self.elapsed_s = time.perf_counter() - t0
+
+    def _wait_until(self, deadline):
+        """ждать до deadline (perf_counter); False - если за это время вызван stop()
+
+        Event.wait может вернуться раньше срока - тогда ожидание повторяется до того же дедлайна.
+        """
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return not self._stop_event.is_set()
+            if self._stop_event.wait(remaining):
+                return False
+
+    def _send(self, buffer, epoch, timestamp, deadline=None):
+        if deadline is not None and np.isfinite(self.speed):
+            lag_ms = max(0.0, (time.perf_counter() - deadline) * 1000)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self.n_late += lag_ms > 1.0
+
+        if self.monitor is not None:
+            self.monitor.mark_arrival(timestamp)
+        with (self.monitor.span("driver", timestamp) if self.monitor is not None else nullcontext()):
+            np.copyto(buffer, epoch.T)      # [n_channels x n_samples] -> [n_samples x n_channels]
+        self.callback(buffer, timestamp)
+        self.n_sent += 1
+
+    def stats(self):
+        rate = self.n_sent / self.elapsed_s if self.elapsed_s > 0 else 0.0
+        return {"sent": self.n_sent, "elapsed_s": self.elapsed_s, "epochs_per_s": rate,
+                "late": self.n_late, "max_lag_ms": self.max_lag_ms}
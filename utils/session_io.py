@@ -0,0 +1,368 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+
+from utils.processing import mep_peak_to_peak
+
+
+try:
+    import hdf5plugin       # LZ4 для HDF5 (необязательная зависимость)
+except ImportError:
+    hdf5plugin = None
+
+FORMAT_VERSION = 2      # 1 - исходный формат: epochs [n_epochs*n_samples x n_channels]; 2 - [n_epochs x n_channels x n_samples]
+STORAGE_TYPES = ("float32", "float16", "int16")    # как хранятся эпохи: вольты как есть или квантованные значения
+INT16_MAX = 32767
+
+
+def int16_scale(full_scale_uV):
+    """шаг квантования int16 [В] по каналам для диапазона +-full_scale_uV (скаляр или [n_channels])"""
+    return np.asarray(full_scale_uV, dtype=float) * 1E-6 / INT16_MAX
+
+
+def fit_int16(lo, hi):
+    """scale и offset по каналам, чтобы значения [lo, hi] (В) заняли весь диапазон int16"""
+    offset = (np.asarray(hi, dtype=float) + lo) / 2
+    scale = np.maximum((np.asarray(hi, dtype=float) - lo) / (2 * INT16_MAX), 1E-12)
+    return scale, offset
+
+
+def compression_kwargs(compression):
+    """аргументы create_dataset для выбранного сжатия: None, 'gzip' или 'lz4'"""
+    if compression is None:
+        return {}
+    if compression == "gzip":
+        return {"compression": "gzip", "compression_opts": 4}
+    if compression == "lz4":
+        if hdf5plugin is None:
+            print("---> hdf5plugin не установлен, вместо lz4 используется gzip")
+            return compression_kwargs("gzip")
+        return dict(hdf5plugin.LZ4())
+    raise ValueError(f"Неизвестный тип сжатия: {compression}")
+
+
+class SessionWriter:
+    """Запись сессии в формате версии 2.
+
+    epochs [n_epochs x n_channels x n_samples], чанк = одна эпоха: чтение или дописывание эпохи
+    затрагивает один чанк. timestamps [n_epochs] - таймстемпы резонанса (нс), индекс эпох.
+    meta/mep_amplitude - размах MEP эпохи [мВ] в окне mep_window (отсчёты эпохи) по разнице двух
+    последних (EMG) каналов; без mep_window и явных значений - NaN. Размах не зависит от бейзлайна,
+    поэтому считается по сырым данным.
+
+    Компактное хранение (storage='int16' или 'float16'): в файл пишется (x - offset) / scale
+    с поканальными scale/offset (датасеты scale и offset), с shuffle перед сжатием.
+    Для int16 scale обязателен (см. int16_scale, fit_int16), значения вне диапазона обрезаются
+    (счётчик n_clipped). Для float16 по умолчанию scale = 1 мкВ.
+    """
+    def __init__(self, file_path, n_channels=66, n_samples=None, Fs=None, compression=None,
+                 storage="float32", scale=None, offset=None, mep_window=None):
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Неизвестный тип хранения: {storage}")
+        if storage == "int16" and scale is None:
+            raise ValueError("Для хранения в int16 нужен шаг квантования scale.")
+
+        self.file_path = file_path
+        self.storage = storage
+        self.mep_window = mep_window
+        self.n_written = 0
+        self.n_clipped = 0          # сколько отсчётов не поместилось в диапазон int16
+        self._h5f = h5py.File(file_path, "w")
+        self._h5f.attrs["format_version"] = FORMAT_VERSION
+        self._h5f.attrs["storage"] = storage
+        if Fs is not None:
+            self._h5f.attrs["Fs"] = Fs
+        self._h5f.attrs["n_samples"] = n_samples
+
+        kwargs = compression_kwargs(compression)
+        self._scale = self._offset = None
+        if storage != "float32":
+            kwargs["shuffle"] = True                # байты одного разряда рядом - сжимаются лучше
+            self._scale = np.broadcast_to(np.asarray(1E-6 if scale is None else scale, dtype=float), (n_channels,))
+            self._offset = np.broadcast_to(np.asarray(0.0 if offset is None else offset, dtype=float), (n_channels,))
+            self._h5f.create_dataset("scale", data=self._scale).attrs["units"] = "V"
+            self._h5f.create_dataset("offset", data=self._offset).attrs["units"] = "V"
+
+        self._epochs = self._h5f.create_dataset("epochs", (0, n_channels, n_samples), maxshape=(None, n_channels, n_samples),
+                                                chunks=(1, n_channels, n_samples), dtype=storage,
+                                                **kwargs)     # для эпох (64 EEG + 2 EMG)
+        self._timestamps = self._h5f.create_dataset("timestamps", (0, ), maxshape=(None, ), chunks=(1024, ),
+                                                    dtype='int64')    # для таймстемпов резонанса (в нс)
+        self._timestamps.attrs["units"] = "ns"
+        meta = self._h5f.create_group("meta")
+        self._mep_amplitude = meta.create_dataset("mep_amplitude", (0, ), maxshape=(None, ), chunks=(1024, ), dtype='float32')
+        self._mep_amplitude.attrs["units"] = "mV"
+        if mep_window is not None:
+            self._mep_amplitude.attrs["window"] = mep_window
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, epochs, timestamps, mep_amplitude=None):
+        # epochs: [n_new x n_channels x n_samples] в вольтах
+        n, n_new = self.n_written, len(epochs)
+        if mep_amplitude is None and self.mep_window is not None:
+            emg = epochs[:, -2:, :] * 1E3                               # [n_new x 2 x n_samples]    units=[mV]
+            mep_amplitude, _ = mep_peak_to_peak(emg[:, 1] - emg[:, 0], *self.mep_window)
+        mep_amplitude = np.nan if mep_amplitude is None else mep_amplitude
+        epochs = self._encode(epochs)
+        for dset, value in [(self._epochs, epochs), (self._timestamps, timestamps), (self._mep_amplitude, mep_amplitude)]:
+            dset.resize(n + n_new, axis=0)
+            dset[n:] = value
+        self.n_written += n_new
+        self._h5f.attrs["n_epochs"] = self.n_written
+
+    def _encode(self, epochs):
+        if self.storage == "float32":
+            return epochs
+        q = (epochs - self._offset[:, np.newaxis]) / self._scale[:, np.newaxis]
+        if self.storage == "float16":
+            return q.astype(np.float16)
+        q = np.rint(q)
+        clipped = np.abs(q) > INT16_MAX
+        if clipped.any():
+            self.n_clipped += int(clipped.sum())
+            np.clip(q, -INT16_MAX, INT16_MAX, out=q)
+        return q.astype(np.int16)
+
+    def flush(self):
+        self._h5f.flush()
+
+    def close(self):
+        self._h5f.close()
+
+
+def write_session(file_path, epochs, timestamps, Fs=None, compression=None, storage="float32", mep_window=None, **meta):
+    """записать все эпохи [n_epochs x n_channels x n_samples] одним вызовом (для int16 диапазон - по данным)"""
+    scale = offset = None
+    if storage == "int16":
+        scale, offset = fit_int16(epochs.min(axis=(0, 2)), epochs.max(axis=(0, 2)))
+    with SessionWriter(file_path, epochs.shape[1], epochs.shape[2], Fs, compression, storage, scale, offset,
+                       mep_window) as writer:
+        writer.append(epochs, timestamps, **meta)
+
+
+class SessionReader:
+    """Ленивое чтение сохранённой сессии: формат версии 2 (SessionWriter) и исходный плоский формат.
+
+    В память загружаются только метаданные. Эпохи и каналы читаются по запросу: в формате 2 -
+    только чанки нужных эпох, в исходном формате - через np.memmap для несжатого непрерывного
+    датасета (без копии всего файла), иначе срезами h5py.
+    n_samples - длина эпохи для исходных файлов без атрибутов (ранний autosave): число эпох
+    тогда - len(epochs) // n_samples. Если длина неизвестна - ValueError.
+    """
+    def __init__(self, file_path, n_samples=None):
+        self.file_path = file_path
+        self.name = os.path.splitext(os.path.basename(file_path))[0]   # имя файла без расширения
+
+        with h5py.File(file_path, "r") as h5f:
+            dset = h5f["epochs"]
+            self.version = int(h5f.attrs.get("format_version", 1))
+            self.dtype = dset.dtype
+            self._offset = None
+            self.storage = h5f.attrs.get("storage", "float32")
+            self._scale = h5f["scale"][:] if "scale" in h5f else None      # квантованное хранение: x = q * scale + offset
+            self._shift = h5f["offset"][:] if "offset" in h5f else None
+            if self.version >= 2:
+                self.n_epochs, self.n_channels, self.n_samples = dset.shape
+                self.Fs = h5f.attrs.get("Fs")
+            else:
+                n_samples = dset.attrs.get("n_samples", n_samples)
+                if n_samples is None:
+                    raise ValueError(f"{self.name}: в файле нет длины эпохи (n_samples), её нужно указать")
+                self.n_samples = int(n_samples)
+                self.n_epochs = int(dset.attrs.get("n_epochs", len(dset) // self.n_samples))
+                self.Fs = dset.attrs.get("Fs")
+                self.n_channels = dset.shape[1]
+                offset = dset.id.get_offset()       # None - датасет сжат или разбит на чанки
+                self._offset = offset if dset.chunks is None and dset.compression is None else None
+
+    def __len__(self):
+        return self.n_epochs
+
+    def _memmap(self):
+        return np.memmap(self.file_path, dtype=self.dtype, mode="r", offset=self._offset,
+                         shape=(self.n_epochs * self.n_samples, self.n_channels))
+
+    def _read_legacy(self, rows, channels=slice(None)):
+        if self._offset is not None:
+            return self._memmap()[rows, channels]
+        with h5py.File(self.file_path, "r") as h5f:
+            return h5f["epochs"][rows, channels]
+
+    def epochs(self, start=0, stop=None):
+        """эпохи [start, stop): [n x n_channels x n_samples] (float32, копия только этого диапазона)"""
+        stop = self.n_epochs if stop is None else min(stop, self.n_epochs)
+        if self.version >= 2:
+            with h5py.File(self.file_path, "r") as h5f:
+                raw = h5f["epochs"][start:stop]
+            if self._scale is None:
+                return np.asarray(raw, dtype=np.float32)
+            return (raw * self._scale[:, np.newaxis] + self._shift[:, np.newaxis]).astype(np.float32)
+        stream = self._read_legacy(slice(start * self.n_samples, stop * self.n_samples))
+        epochs = np.asarray(stream, dtype=np.float32).reshape(stop - start, self.n_samples, self.n_channels)
+        return epochs.transpose(0, 2, 1)
+
+    def epoch(self, k):
+        """эпоха k: [n_channels x n_samples]"""
+        return self.epochs(k, k + 1)[0]
+
+    def channel(self, c, start=0, stop=None):
+        """канал c эпох [start, stop): [n x n_samples]"""
+        stop = self.n_epochs if stop is None else min(stop, self.n_epochs)
+        if self.version >= 2:
+            with h5py.File(self.file_path, "r") as h5f:
+                raw = h5f["epochs"][start:stop, c, :]
+            if self._scale is None:
+                return np.asarray(raw, dtype=np.float32)
+            return (raw * self._scale[c] + self._shift[c]).astype(np.float32)
+        stream = self._read_legacy(slice(start * self.n_samples, stop * self.n_samples), c)
+        return np.asarray(stream, dtype=np.float32).reshape(stop - start, self.n_samples)
+
+    def timestamps(self):
+        with h5py.File(self.file_path, "r") as h5f:
+            if "timestamps" in h5f:
+                return h5f["timestamps"][:]
+        return np.zeros(self.n_epochs, dtype=np.int64)
+
+    def metadata(self):
+        """mep_amplitude [мВ] для всех эпох (в исходном формате - не известна, NaN)"""
+        meta = {"mep_amplitude": np.full(self.n_epochs, np.nan, dtype=np.float32)}
+        if self.version >= 2:
+            with h5py.File(self.file_path, "r") as h5f:
+                for name in meta:
+                    if name in h5f["meta"]:
+                        meta[name] = h5f["meta"][name][:]
+        return meta
+
+    def iter_chunks(self, start=0, chunk_epochs=64):
+        """пачки эпох по chunk_epochs, начиная с эпохи start"""
+        for i in range(start, self.n_epochs, chunk_epochs):
+            yield self.epochs(i, i + chunk_epochs)
+
+
+def session_summary(reader, transform, baseline, average_function=None, n_max=None, aver_all=True, chunk_epochs=64):
+    """Всё, что нужно для отрисовки сессии в режиме сравнения, за один потоковый проход по файлу.
+
+    transform - цепочка преобразований TEPs (пачка -> пачка), baseline - Baseline для EMG,
+    average_function(data, n_max, aver_all) - функция усреднения или None (одиночная проба - последняя эпоха).
+    Без aver_all читаются только последние n_max эпох. В памяти одновременно - одна пачка эпох
+    и состояние функции усреднения.
+    Возвращает dict: TEPs [n_channels-2 x n_samples] (мкВ), MEP [n_samples] (мВ), n_epochs.
+    Для файла без эпох - ValueError.
+    """
+    n = len(reader)
+    if n == 0:
+        raise ValueError(f"{reader.name}: в файле нет эпох")
+    mep_sum = np.zeros(reader.n_samples)
+    for chunk in reader.iter_chunks(chunk_epochs=chunk_epochs):
+        emg = baseline(chunk[:, -2:, :] * 1E3)                 # -> [n_chunk x 2 x n_samples]    units=[mV]
+        mep_sum += (emg[:, 1] - emg[:, 0]).sum(axis=0)         # разница каналов
+
+    if average_function is None:
+        TEPs = transform(reader.epoch(n - 1)[:-2] * 1E6)       # последняя эпоха
+    else:
+        average = average_function(np.empty((0, reader.n_channels - 2, reader.n_samples)), n_max, aver_all)
+        start = 0 if aver_all else max(0, n - n_max)
+        for chunk in reader.iter_chunks(start, chunk_epochs):
+            for epoch in transform(chunk[:, :-2] * 1E6):       # вся пачка за один проход цепочки
+                average.add(epoch)
+        TEPs = average.calculate()
+
+    return {"TEPs": TEPs, "MEP": mep_sum / n, "n_epochs": n}
+
+
+def file_fingerprint(file_path, block_size=1 << 20):
+    """sha1 от (путь, размер, время изменения) + первого и последнего блока файла - без чтения всего файла"""
+    stat = os.stat(file_path)
+    digest = hashlib.sha1(repr((os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)).encode())
+    with open(file_path, "rb") as f:
+        digest.update(f.read(block_size))              # заголовок HDF5 и начало данных
+        if stat.st_size > block_size:
+            f.seek(max(block_size, stat.st_size - block_size))
+            digest.update(f.read(block_size))          # хвост: последние дописанные эпохи
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """Кэш результатов session_summary: ключ - отпечаток файла (file_fingerprint) + параметры обработки.
+
+    В памяти - LRU на max_items сводок. С on_disk=True сводки ещё и сохраняются рядом с файлом
+    сессии (папка .summary_cache, один .npz на ключ) и переживают перезапуск программы.
+    params должны описывать настройки, с которыми будет вызван compute (а не чужое изменяемое состояние).
+    """
+    def __init__(self, max_items=32, on_disk=False):
+        self.max_items = max_items
+        self.on_disk = on_disk
+        self._items = OrderedDict()     # ключ -> сводка
+
+    def _disk_path(self, file_path, digest):
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), ".summary_cache", f"{digest}.npz")
+
+    def get(self, reader, params, compute):
+        """сводка сессии reader для параметров params (hashable); при промахе - compute()"""
+        key = (file_fingerprint(reader.file_path), params)
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = self._disk_path(reader.file_path, digest)
+        if self.on_disk and os.path.exists(path):
+            with np.load(path) as npz:
+                summary = {"TEPs": npz["TEPs"], "MEP": npz["MEP"], "n_epochs": int(npz["n_epochs"])}
+        else:
+            summary = compute()
+            if self.on_disk:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    np.savez(path, **summary)
+                except OSError as e:    # папка только для чтения и т.п. - остаётся кэш в памяти
+                    print(f"---> Не удалось сохранить кэш сводки: {e}")
+
+        self._items[key] = summary
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+        return summary
+
+
+def convert_session(src_path, dst_path, storage="int16", compression="gzip", chunk_epochs=64, n_samples=None):
+    """переписать сессию (любой поддерживаемый формат) в формат 2 с типом хранения storage
+
+    Для int16 сначала проходом по файлу ищется диапазон каждого канала. Возвращает SessionWriter
+    (n_written, n_clipped). n_samples - для исходных файлов без атрибутов (см. SessionReader).
+    """
+    reader = SessionReader(src_path, n_samples)
+    scale = offset = None
+    if storage == "int16":
+        lo = np.full(reader.n_channels, np.inf)
+        hi = np.full(reader.n_channels, -np.inf)
+        for chunk in reader.iter_chunks(chunk_epochs=chunk_epochs):
+            lo = np.minimum(lo, chunk.min(axis=(0, 2)))
+            hi = np.maximum(hi, chunk.max(axis=(0, 2)))
+        scale, offset = fit_int16(lo, hi)
+
+    timestamps, meta = reader.timestamps(), reader.metadata()
+    with SessionWriter(dst_path, reader.n_channels, reader.n_samples, reader.Fs, compression,
+                       storage, scale, offset) as writer:
+        for i, chunk in enumerate(reader.iter_chunks(chunk_epochs=chunk_epochs)):
+            rows = slice(i * chunk_epochs, i * chunk_epochs + len(chunk))
+            writer.append(chunk, timestamps[rows], **{name: values[rows] for name, values in meta.items()})
+    return writer
+
+
+def quantization_error(reference_path, compact_path, chunk_epochs=64, n_samples=None):
+    """максимальная абсолютная ошибка по каналам [мкВ] между двумя файлами одной сессии"""
+    reference, compact = SessionReader(reference_path, n_samples), SessionReader(compact_path)
+    if (len(reference), reference.n_channels, reference.n_samples) != (len(compact), compact.n_channels, compact.n_samples):
+        raise ValueError("Файлы содержат разные сессии: не совпадают размеры.")
+    error = np.zeros(reference.n_channels)
+    for a, b in zip(reference.iter_chunks(chunk_epochs=chunk_epochs), compact.iter_chunks(chunk_epochs=chunk_epochs)):
+        error = np.maximum(error, np.abs(a.astype(float) - b).max(axis=(0, 2)) * 1E6)
+    return error
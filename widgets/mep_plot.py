@@ -10,6 +10,8 @@ from PyQt5.QtCore import pyqtSignal
 import numpy as np
 from collections import deque
 
+from utils.processing import mep_peak_to_peak
+
 class MEPPlot(FigureCanvas):
     amp_counter = pyqtSignal(int)  
 
@@ -168,14 +170,10 @@ class MEPPlot(FigureCanvas):
         self.amps = np.roll(self.amps, 1)
         self.lats = np.roll(self.lats, 1)
 
-        x = data[self.start_amp:self.end_amp]
-        
-        # Индексы глобального минимума/максимума 
-        min_ind = int(np.argmin(x))
-        max_ind = int(np.argmax(x))
+        amp, max_ind = mep_peak_to_peak(data, self.start_amp, self.end_amp)    # размах в окне и индекс максимума
 
-        self.amps[0] = round(float(x[max_ind] - x[min_ind]), 2)
-        self.lats[0] = round(((max_ind - self.params["xmin_ms"]) * 1000/self.params["Fs"]))
+        self.amps[0] = round(float(amp), 2)
+        self.lats[0] = round(((int(max_ind) - self.params["xmin_ms"]) * 1000/self.params["Fs"]))
 
         for i in range(self.params["n_plots"]):
             title = f"#{i+1}" if self.amps[i] is None else f"#{i+1} : {self.amps[i]} mV, {self.lats[i]} ms"
@@ -6,13 +6,65 @@ from matplotlib import colormaps as cm
 from matplotlib.colors import ListedColormap
 import numpy as np
 import time
-from copy import deepcopy
 
 from utils.helpers import get_time_ticks, get_voltage_ticks
 
-class TEPsPlot(FigureCanvas):
+
+class TraceGridMixin:
+    """Подготовка данных для сетки мини-графиков (общая для бэкендов отрисовки TEPs).
+
+    Использует атрибуты отрисовщика: _last_xlim, _last_ylim, _xdata (нормированная ось абсцисс),
+    _single_w (ширина графика в пикселях) и _decimate.
+    """
+    def set_x_shift(self, x_shift, window_dur):
+        self._x = np.linspace(x_shift, window_dur+x_shift, window_dur)
+        self._update_visible()
+
+    def _update_visible(self):
+        """видимый диапазон отсчётов, NaN-дополнение по краям и корзины прореживания - один раз на смену оси абсцисс"""
+        if not hasattr(self, "_x") or self._last_xlim is None:
+            return
+        xmin, xmax = self._last_xlim
+        idx = np.flatnonzero((self._x > xmin) & (self._x < xmax))
+        self._visible = slice(idx[0], idx[-1] + 1) if len(idx) else slice(0, 0)
+        self._pad_left = int(self._x[0] - xmin) if self._x[0] > xmin else 0     # пустое место слева от начала эпохи
+
+        n_points = len(self._xdata)
+        assert self._pad_left + len(idx) <= n_points, f"widgets/teps_plot: len(x_new) = {n_points} < len(y_new) = {self._pad_left + len(idx)}"
+
+        self._bins = None
+        self._xdata_plot = self._xdata
+        if self._decimate and n_points > 2 * self._single_w:
+            self._bins = np.linspace(0, n_points, self._single_w, endpoint=False).astype(int)   # начала корзин: одна на пиксель
+            self._xdata_plot = np.repeat(self._xdata[self._bins], 2)                             # min и max корзины в одной точке
+
+    def _prepare_traces(self, data):
+        """все каналы сразу: видимая часть, NaN вне [ymin, ymax], нормализация и прореживание -> [n_channels x n_points]"""
+        ymin, ymax = self._last_ylim
+        visible = np.asarray(data)[:, self._visible]
+
+        y = np.full((len(visible), len(self._xdata)), np.nan)
+        y[:, self._pad_left:self._pad_left + visible.shape[1]] = visible
+        y[(y < ymin) | (y > ymax)] = np.nan
+        y -= ymin                               # нормализация по оси ординат на месте
+        y /= (ymax - ymin)
+
+        if self._bins is not None:
+            decimated = np.empty((len(y), 2 * len(self._bins)))
+            decimated[:, 0::2] = np.fmin.reduceat(y, self._bins, axis=1)    # fmin/fmax пропускают NaN
+            decimated[:, 1::2] = np.fmax.reduceat(y, self._bins, axis=1)
+            y = decimated
+        return y
+
+    def _normalize(self, x, axis='x'):
+        assert hasattr(self, "_last_xlim"), f"Границы графика ещё не заданы -> невозможно нормализовать данные по оси {axis}."
+        xmin, xmax = self._last_xlim if axis == 'x' else self._last_ylim
+        return (x - xmin) / (xmax - xmin)
+
+
+class TEPsPlot(TraceGridMixin, FigureCanvas):
     """Класс для отрисовки графиков"""
-    def __init__(self, parent=None, positions=None, single_w=300, single_h=200, w=1000, h=700, dpi=100, channels=None):
+    def __init__(self, parent=None, positions=None, single_w=300, single_h=200, w=1000, h=700, dpi=100, channels=None, decimate=False):
         figsize = (w/dpi, h/dpi)
         self.fig = Figure(figsize=figsize, dpi=100) 
         self.fig.patch.set_alpha(0.0)                          # Делаем фон холста matplolib прозрачным
@@ -93,10 +145,11 @@ class TEPsPlot(FigureCanvas):
         self._xdata = []
         self._ydata = None
 
-        self._viridisBig = cm.get_cmap('jet')
+        self._single_w = int(single_w)      # ширина одного графика в пикселях (для прореживания)
+        self._decimate = decimate           # min/max прореживание до ширины графика
+        self._visible = None                # видимые отсчёты эпохи (пересчитываются при смене оси абсцисс)
 
-    def set_x_shift(self, x_shift, window_dur):
-        self._x = np.linspace(x_shift, window_dur+x_shift, window_dur)
+        self._viridisBig = cm.get_cmap('jet')
 
     def update_axes(self, limits):
         xmin, xmax, ymin, ymax = limits
@@ -109,6 +162,7 @@ class TEPsPlot(FigureCanvas):
         
         if x_changed:
             self._xdata = self._normalize(np.linspace(xmin, xmax, (xmax-xmin)), axis='x')  # новая ось абсцисс
+            self._update_visible()
 
         axis_pos = (np.abs(xmin)/(xmax-xmin), np.abs(ymin)/(ymax-ymin))   # новые отнормированные позиции
         xticks_limits = [axis_pos[0]-0.02, axis_pos[0]+0.02]
@@ -151,30 +205,12 @@ class TEPsPlot(FigureCanvas):
 
         assert hasattr(self, "_x"), "не установлены смещение по оси абсцисс и длина окна"
 
-        xmin, xmax = self._last_xlim
-        ymin, ymax = self._last_ylim
-
         self.fig.canvas.restore_region(self.background_axes) # восстанавливаем чистый фон
 
-        for i, y_new in enumerate(data):
-            y = deepcopy(y_new)
-            y = y[np.where((self._x > xmin) & (self._x < xmax))].tolist()
-
-            if self._x[0] > xmin:
-                y = [np.nan] * (self._x[0] - xmin) + y
-            if self._x[-1] < xmax:
-                y = y + [np.nan] * (xmax - self._x[-1])
-
-            y = np.array(y)
-            y[np.where((y < ymin) | (y > ymax))] = np.nan
-
-            assert len(self._xdata) == len(y), f"widgets/teps_plot: len(x_new) = {len(self._xdata)} !=  len(y_new) = {len(y)}"
-            
-            y = self._normalize(y, axis='y')
-            
-            self.lines[i].set_data(self._xdata, y)
-
-            self.ax.draw_artist(self.lines[i])
+        traces = self._prepare_traces(data)     # [n_channels x n_points] - все каналы за один проход
+        for line, y in zip(self.lines, traces):
+            line.set_data(self._xdata_plot, y)
+            self.ax.draw_artist(line)
 
         self.fig.canvas.blit(self.ax.bbox)
 
@@ -188,24 +224,11 @@ class TEPsPlot(FigureCanvas):
         colors = ListedColormap(self._viridisBig(np.linspace(0, 1, len(data_all))))
 
         colors = ["green", "orange", "darkred", "pink"]
-        xmin, xmax = self._last_xlim
-        ymin, ymax = self._last_ylim
+        traces_all = [self._prepare_traces(data) for data in data_all]
 
         for i in range(64):    # для каждого канала
-            for k, data in enumerate(data_all):
-                y = deepcopy(data[i])
-                y = y[np.where((self._x > xmin) & (self._x < xmax))].tolist()
-
-                if self._x[0] > xmin:
-                    y = [np.nan] * (self._x[0] - xmin) + y
-                if self._x[-1] < xmax:
-                    y = y + [np.nan] * (xmax - self._x[-1])
-
-                y = np.array(y)
-                y[np.where((y < ymin) | (y > ymax))] = np.nan
-
-                y = self._normalize(y, axis='y')
-                line, = self.ax.plot(self._xdata, y, lw=0.8, transform=self.transforms[i], color=colors[k])
+            for k, traces in enumerate(traces_all):
+                line, = self.ax.plot(self._xdata_plot, traces[i], lw=0.8, transform=self.transforms[i], color=colors[k])
                 self.ax.draw_artist(line)
 
         self.fig.canvas.blit(self.ax.bbox)
@@ -227,13 +250,6 @@ class TEPsPlot(FigureCanvas):
         self.fig.canvas.restore_region(self.background_axes) # восстанавливаем чистый фон
         self.fig.canvas.blit(self.ax.bbox)
 
-    def _normalize(self, x, axis='x'):
-        assert hasattr(self, "_last_xlim"), f"Границы графика ещё не заданы -> невозможно нормализовать данные по оси {axis}."
-        xmin, xmax = self._last_xlim if axis == 'x' else self._last_ylim
-        return (x - xmin) / (xmax - xmin)
-    
-    
-    
     def update_position(self, positions=None, single_w=300, single_h=200, w=1000, h=700, dpi=100):
         fig_w, fig_h = self.fig.get_size_inches() * self.fig.dpi  # ширина и высота в пикселях
 
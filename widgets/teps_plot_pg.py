@@ -0,0 +1,186 @@
+import numpy as np
+from PyQt5.QtGui import QTransform, QFont      # PyQt5 до pyqtgraph: он берёт уже загруженную привязку Qt
+import pyqtgraph as pg
+
+from widgets.teps_plot import TraceGridMixin
+
+pg.setConfigOptions(useOpenGL=False, antialias=False)     # программная растеризация: работает без GPU
+
+SESSION_COLORS = ["green", "orange", "darkred", "pink"]   # цвета загруженных сессий (как в TEPsPlot)
+
+
+class TEPsPlotPG(TraceGridMixin, pg.PlotWidget):
+    """Сетка TEPs на pyqtgraph - альтернатива TEPsPlot с тем же интерфейсом.
+
+    Одна ViewBox в пиксельных координатах панели, на каждый канал - один PlotCurveItem,
+    который масштабируется и сдвигается в свой прямоугольник (данные нормированы в [0, 1]).
+    Псевдооси и риски всех графиков - два PlotCurveItem с connect='pairs', поэтому смена
+    масштаба - это обновление двух массивов, а не перерисовка всего холста.
+    Позиции задаются в пикселях размера (w, h) при создании; при изменении размера виджета
+    сетка растягивается вместе с ним (как оси TEPsPlot в долях холста), а ViewBox остаётся
+    в пикселях текущего размера.
+    """
+    def __init__(self, parent=None, positions=None, single_w=300, single_h=200, w=1000, h=700, dpi=100, channels=None, decimate=False):
+        super().__init__(parent=parent, background=None)
+        self.resize(int(w), int(h))
+        self.setStyleSheet("background-color:transparent;")    # делаем виджет прозрачным
+
+        self.hideAxis('left')
+        self.hideAxis('bottom')
+        self.hideButtons()
+        self.setMenuEnabled(False)
+        self.setMouseEnabled(x=False, y=False)
+        self.setRange(xRange=(0, w), yRange=(0, h), padding=0)     # координаты сцены = пиксели панели (начало снизу слева)
+
+        channels = [f"CH{i+1}" for i in range(len(positions)-1)] if channels is None else channels.tolist()
+        titles = channels + ['']   # последнее без названия - для осей с указанием масштаба
+
+        self._frame = np.array([w, h], dtype=float)                             # размер, для которого заданы позиции
+        self._base_positions = np.asarray(positions, dtype=float)
+        self._base_size = np.array([single_w, single_h], dtype=float)
+        self._positions = self._base_positions.copy()                           # позиции и размер графиков при текущем размере
+        self._size = self._base_size.copy()
+        self._grid = []             # (элемент, отрезки одного графика) для псевдоосей и рисок
+
+        self.n_xticks = 5
+        self.n_yticks = 4
+
+        self._axes_item = pg.PlotCurveItem(pen=pg.mkPen((0, 0, 0, 153), width=1), connect='pairs')    # псевдооси всех графиков
+        self._ticks_item = pg.PlotCurveItem(pen=pg.mkPen('gray', width=1), connect='pairs')            # риски всех графиков
+        self.addItem(self._axes_item)
+        self.addItem(self._ticks_item)
+
+        font = QFont()
+        font.setPointSize(8)
+        self.lines = []             # кривые последней эпохи / среднего
+        self.texts = []             # названия графиков
+        for (x_px, y_px), title in zip(positions, titles):
+            self.lines.append(self._create_curve(x_px, y_px, '#1f77b4'))
+
+            txt = pg.TextItem(title, color='gray', anchor=(0.5, 0.5))
+            txt.setFont(font)
+            txt.setPos(x_px + single_w / 2, y_px + single_h * 0.8)
+            self.addItem(txt)
+            self.texts.append(txt)
+
+        self._session_lines = []    # кривые загруженных сессий: [n_sessions][n_channels]
+
+        self._last_xlim = None  # границы по оси х не заданы
+        self._last_ylim = None  # границы по оси y не заданы
+
+        self._xdata = []
+        self._ydata = None
+
+        self._single_w = int(single_w)      # ширина одного графика в пикселях (для прореживания)
+        self._decimate = decimate           # min/max прореживание до ширины графика
+        self._visible = None
+
+    def _create_curve(self, x_px, y_px, color):
+        curve = pg.PlotCurveItem(pen=pg.mkPen(color, width=1), connect='finite')
+        self._place_curve(curve, x_px, y_px)
+        self.addItem(curve)
+        return curve
+
+    def _place_curve(self, curve, x_px, y_px):
+        curve.setTransform(QTransform.fromScale(*self._size))    # [0, 1] x [0, 1] -> прямоугольник графика
+        curve.setPos(x_px, y_px)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if hasattr(self, "_frame"):         # PlotWidget может получить resize ещё в своём __init__
+            self._relayout()
+
+    def _relayout(self):
+        """пересчитать позиции графиков под текущий размер виджета и привязать к нему ViewBox"""
+        w, h = self.width(), self.height()
+        if w <= 0 or h <= 0:
+            return
+        scale = np.array([w, h]) / self._frame
+        self._positions = self._base_positions * scale
+        self._size = self._base_size * scale
+        self.setRange(xRange=(0, w), yRange=(0, h), padding=0)
+
+        for curves in [self.lines] + self._session_lines:
+            for curve, (x_px, y_px) in zip(curves, self._positions):
+                self._place_curve(curve, x_px, y_px)
+        for txt, (x_px, y_px) in zip(self.texts, self._positions):
+            txt.setPos(x_px + self._size[0] / 2, y_px + self._size[1] * 0.8)
+        self._draw_grid()
+
+    def _draw_grid(self):
+        """отрезки одного графика -> отрезки всех графиков в пикселях панели"""
+        for item, segments in self._grid:
+            points = (segments[np.newaxis] * self._size + self._positions[:, np.newaxis]).reshape(-1, 2)
+            item.setData(points[:, 0], points[:, 1])
+
+    def update_axes(self, limits):
+        xmin, xmax, ymin, ymax = limits
+
+        x_changed = self._last_xlim != (xmin, xmax)
+
+        self._last_xlim = (xmin, xmax)
+        self._last_ylim = (ymin, ymax)
+
+        if x_changed:
+            self._xdata = self._normalize(np.linspace(xmin, xmax, (xmax-xmin)), axis='x')  # новая ось абсцисс
+            self._update_visible()
+
+        ax, ay = np.abs(xmin)/(xmax-xmin), np.abs(ymin)/(ymax-ymin)     # новые отнормированные позиции осей
+        axes = np.array([[0, ay], [1, ay], [ax, 0], [ax, 1]])
+
+        xticks = self._normalize(np.linspace(0, xmax+1, self.n_xticks), axis='x')
+        yticks = np.linspace(0.1, 0.9, self.n_yticks)
+        ticks = np.concatenate([
+            np.stack([np.repeat(xticks, 2), np.tile([ay-0.02, ay+0.02], len(xticks))], axis=1),
+            np.stack([np.tile([ax-0.02, ax+0.02], len(yticks)), np.repeat(yticks, 2)], axis=1),
+        ])
+
+        self._grid = [(self._axes_item, axes), (self._ticks_item, ticks)]
+        self._draw_grid()
+
+        if self._ydata is not None:
+            self.update_data(self._ydata)
+
+    def update_data(self, data):
+        # data [MICROVOLT] - TEP
+
+        assert hasattr(self, "_x"), "не установлены смещение по оси абсцисс и длина окна"
+
+        traces = self._prepare_traces(data)     # [n_channels x n_points] - все каналы за один проход
+        for line, y in zip(self.lines, traces):
+            line.setData(self._xdata_plot, y)
+            line.setVisible(True)
+        self._set_sessions_visible(0)
+
+        self._ydata = data
+
+    def draw_loaded_TEPs(self, data_all, labels):
+        # data_all : list of np.arrays [n_channels, n_samples]
+        for line in self.lines:
+            line.setVisible(False)
+
+        for k, data in enumerate(data_all):
+            if k == len(self._session_lines):
+                color = SESSION_COLORS[k % len(SESSION_COLORS)]
+                self._session_lines.append([self._create_curve(x_px, y_px, color) for x_px, y_px in self._positions[:-1]])
+            traces = self._prepare_traces(data)
+            for line, y in zip(self._session_lines[k], traces):
+                line.setData(self._xdata_plot, y)
+        self._set_sessions_visible(len(data_all))
+
+        for i, label in enumerate(labels):
+            print(f">> {label} : {SESSION_COLORS[i % len(SESSION_COLORS)]}")
+
+    def update_image(self):
+        for line in self.lines:
+            line.setVisible(True)
+
+    def refresh_plot(self):
+        for line in self.lines:
+            line.setVisible(False)
+        self._set_sessions_visible(0)
+
+    def _set_sessions_visible(self, n):
+        for k, session in enumerate(self._session_lines):
+            for line in session:
+                line.setVisible(k < n)
@@ -10,12 +10,49 @@ import mne
 from mne.viz.topomap import _make_head_outlines, _setup_interp
 from mne.viz.topomap import _plot_topomap
 import numpy as np
+import os
 import pandas as pd
-from scipy.interpolate import LinearNDInterpolator, griddata
+from scipy.interpolate import LinearNDInterpolator, CloughTocher2DInterpolator, NearestNDInterpolator, griddata
+from scipy.spatial import Delaunay
+from matplotlib.artist import Artist
+from matplotlib.ticker import MaxNLocator
 
 from matplotlib import colormaps as cm
 from matplotlib.colors import ListedColormap
 
+def interpolation_matrix(pos, xi, yi, method='cubic', n_border=32):
+    """линейный оператор датчики -> сетка изображения: z = W @ values, W: [n_grid x n_sensors]
+
+    Вокруг датчиков добавляется кольцо точек, значение в каждой из которых - среднее по соседним
+    датчикам (как border='mean' в mne). Интерполяция линейна по значениям, поэтому W получается
+    интерполяцией единичной матрицы: столбец k - отклик сетки на единицу в датчике k.
+    Точки сетки вне выпуклой оболочки получают nan (прозрачные пиксели).
+    """
+    n = len(pos)
+    r = max(0.5, np.linalg.norm(pos, axis=1).max()) * 1.1
+    angles = np.linspace(0, 2 * np.pi, n_border, endpoint=False)
+    points = np.vstack([pos, r * np.column_stack([np.cos(angles), np.sin(angles)])])
+
+    tri = Delaunay(points)
+    indptr, indices = tri.vertex_neighbor_vertices
+    basis = np.zeros((len(points), n))                  # значения всех точек через значения датчиков
+    basis[:n] = np.eye(n)
+    for k in range(n, len(points)):
+        neighbours = indices[indptr[k]:indptr[k + 1]]
+        neighbours = neighbours[neighbours < n]
+        if len(neighbours) == 0:                        # нет соседних датчиков - среднее по всем
+            neighbours = np.arange(n)
+        basis[k, neighbours] = 1 / len(neighbours)
+
+    if method == 'cubic':
+        interp = CloughTocher2DInterpolator(tri, basis)
+    elif method == 'linear':
+        interp = LinearNDInterpolator(tri, basis)
+    else:
+        interp = NearestNDInterpolator(points, basis)
+    return interp(np.column_stack([xi.ravel(), yi.ravel()]))
+
+
 class ColorBar(QFrame):
     def __init__(self, parent=None, w=100, h=270, image=None):
         super().__init__(parent)
@@ -60,7 +97,7 @@ class TopoPlot(QFrame):
         self.setStyleSheet("background-color: white; border: 2px solid gray;")
         
         # --- параметры для отрисовки голов ---
-        filename = r".\resources\mumeg_mks64.ced"
+        filename = os.path.join("resources", "mumeg_mks64.ced")
         df = pd.read_csv(filename, sep="\t")
 
         self.channels = df.labels.values
@@ -118,7 +155,7 @@ class TopoPlot(QFrame):
                 cmap=self._cmap,
                 vlim=self._vlim,
                 sphere=0.5,
-                contours=self.params["countours"],
+                contours=0,                     # контуры строятся отдельно (_update_contours)
                 ch_type='eeg', 
                 extrapolate='head',
                 sensors=self.params["sensors"],
@@ -126,6 +163,21 @@ class TopoPlot(QFrame):
             )
         
         self.im = im
+
+        # --- оператор интерполяции на сетку изображения (строится один раз) ---
+        ny, nx = im.get_array().shape
+        left, right, bottom, top = im.get_extent()
+        self._xi, self._yi = np.meshgrid(np.linspace(left, right, nx), np.linspace(bottom, top, ny))
+        self._W = interpolation_matrix(self._pos, self._xi, self._yi, method=self.params["image_interp"])
+        self._contour_levels = MaxNLocator(self.params["countours"] + 1).tick_values(*self._vlim)
+        self._contours = []
+
+        # --- blit: голова, датчики и контуры перерисуются поверх обновлённого изображения ---
+        self._overlay = [*self.ax.lines, *self.ax.collections]
+        for artist in [self.im, *self._overlay]:
+            artist.set_animated(True)
+        self._background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
         
         # self.interp = interp
 
@@ -164,33 +216,46 @@ class TopoPlot(QFrame):
         self.canvas.setAttribute(Qt.WA_TransparentForMouseEvents, True)
 
     # --- Логика ---
-    def plot_topomap(self, data):
+    def plot_topomap(self, data, contours=None):
         # data: 1D array of sensor values (len == n_channels)
-        # zi =  self.data2z(data)
-        # self.im.set_data(zi)
-        # self.ax.draw_artist(self.im)
-        # self.
-        # zi = self.interp(data)
-        # self.im.set_array(zi.ravel())  # обновляем изображение
-        self.ax.cla()
-        im, _ = mne.viz.plot_topomap(
-                data, 
-                self._pos, 
-                axes=self.ax,
-                show=False,
-                cmap=self._cmap,
-                vlim=self._vlim,
-                sphere=0.5,
-                contours=self.params["countours"],
-                ch_type='eeg', 
-                extrapolate='head',
-                sensors=self.params["sensors"],
-                image_interp=self.params["image_interp"]  
-            )
-        self.ax.set_title(f"{self.timestamp} ms", loc='right')
-        # self.ax.draw_artist(im)
-        # self.canvas.blit(self.ax.bbox)
-        self.canvas.draw_idle()
+        # contours: пересчитать контуры (по умолчанию - по настройке contours_live)
+        zi = (self._W @ np.asarray(data, dtype=float)).reshape(self._xi.shape)
+        self.im.set_data(zi)
+        if contours is None:
+            contours = self.params["contours_live"]
+        if contours:
+            self._update_contours(zi)
+
+        if self._background is None:        # холст ещё не отрисован - фона для blit нет
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    def _update_contours(self, zi):
+        for artist in self._contours:
+            artist.remove()
+            self._overlay.remove(artist)
+        self._contours = []
+        if self.params["countours"] == 0 or np.all(np.isnan(zi)):
+            return
+        cs = self.ax.contour(self._xi, self._yi, zi, self._contour_levels, colors='k', linewidths=0.5)
+        self._contours = [cs] if isinstance(cs, Artist) else list(cs.collections)   # matplotlib < 3.8 - список коллекций
+        for artist in self._contours:
+            artist.set_animated(True)
+            artist.set_clip_path(self.im.get_clip_path())
+        self._overlay.extend(self._contours)
+
+    def _on_draw(self, event):
+        # полная перерисовка (resize и т.п.): запомнить фон без анимируемых объектов и дорисовать их
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.ax.draw_artist(self.im)
+        for artist in self._overlay:
+            self.ax.draw_artist(artist)
 
     # --- События ---
     def mousePressEvent(self, event):